@@ -3,28 +3,26 @@ Ripple Language - AST 节点定义
 抽象语法树节点类型
 """
 
-from dataclasses import dataclass, field
-from typing import List, Optional, Any, Dict, Tuple
-from abc import ABC, abstractmethod
+from __future__ import annotations
 
+import sys
+from dataclasses import dataclass
+from typing import Optional, Any
 
-class ASTNode(ABC):
-    """AST 节点基类"""
 
-    @abstractmethod
-    def __repr__(self):
-        pass
+class ASTNode:
+    """AST 节点基类（普通基类，避免 ABCMeta 的 isinstance 开销；各具体节点自行实现 __repr__）"""
+    __slots__ = ()
 
 
 # ================== 类型节点 ==================
 
-@dataclass
 class TypeNode(ASTNode):
     """类型节点基类"""
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class BasicType(TypeNode):
     """基本类型：int, float, bool, string"""
     name: str  # 'int', 'float', 'bool', 'string'
@@ -33,7 +31,7 @@ class BasicType(TypeNode):
         return f"BasicType({self.name})"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class StreamType(TypeNode):
     """流类型：Stream<T>"""
     element_type: TypeNode
@@ -42,7 +40,7 @@ class StreamType(TypeNode):
         return f"Stream<{self.element_type}>"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class ArrayType(TypeNode):
     """数组类型：[T]"""
     element_type: TypeNode
@@ -51,10 +49,10 @@ class ArrayType(TypeNode):
         return f"[{self.element_type}]"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class FunctionType(TypeNode):
     """函数类型"""
-    param_types: List[TypeNode]
+    param_types: list[TypeNode]
     return_type: TypeNode
 
     def __repr__(self):
@@ -62,10 +60,10 @@ class FunctionType(TypeNode):
         return f"({params}) -> {self.return_type}"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class StructType(TypeNode):
     """结构体类型：{ x: int, y: int }"""
-    fields: Dict[str, TypeNode]  # 字段名 -> 字段类型
+    fields: dict[str, TypeNode]  # 字段名 -> 字段类型
 
     def __repr__(self):
         fields_str = ', '.join(f"{k}: {v}" for k, v in self.fields.items())
@@ -74,13 +72,18 @@ class StructType(TypeNode):
 
 # ================== 表达式节点 ==================
 
-@dataclass
 class Expression(ASTNode):
     """表达式节点基类"""
-    pass
+    # _stateful: 构造时自底向上标记的“是否包含 pre/fold”，子节点总是先于父节点构造
+    # _deps: 无局部变量时的依赖列表，首次 extract_dependencies 时填入（节点不可变，结果不会过期）
+    __slots__ = ('_stateful', '_deps')
+
+    def __post_init__(self):
+        object.__setattr__(self, '_stateful', _compute_stateful(self))
+        object.__setattr__(self, '_deps', None)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class Literal(Expression):
     """字面量"""
     value: Any
@@ -90,17 +93,17 @@ class Literal(Expression):
         return f"Literal({self.value}:{self.type_name})"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class ArrayLiteral(Expression):
     """数组字面量：[1, 2, 3]"""
-    elements: List[Expression]
+    elements: list[Expression]
 
     def __repr__(self):
         elems = ', '.join(str(e) for e in self.elements)
         return f"[{elems}]"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class ArrayAccess(Expression):
     """数组索引访问：arr[index]"""
     array: Expression
@@ -110,17 +113,17 @@ class ArrayAccess(Expression):
         return f"{self.array}[{self.index}]"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class StructLiteral(Expression):
     """结构体字面量：{ x: 1, y: 2 }"""
-    fields: Dict[str, Expression]  # 字段名 -> 字段值表达式
+    fields: tuple[tuple[str, Expression], ...]  # (字段名, 字段值表达式)，按声明顺序
 
     def __repr__(self):
-        fields_str = ', '.join(f"{k}: {v}" for k, v in self.fields.items())
+        fields_str = ', '.join(f"{k}: {v}" for k, v in self.fields)
         return f"{{ {fields_str} }}"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class FieldAccess(Expression):
     """字段访问：obj.field"""
     object: Expression
@@ -130,7 +133,7 @@ class FieldAccess(Expression):
         return f"{self.object}.{self.field_name}"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class Identifier(Expression):
     """标识符"""
     name: str
@@ -139,7 +142,7 @@ class Identifier(Expression):
         return f"Identifier({self.name})"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class BinaryOp(Expression):
     """二元操作符"""
     operator: str  # '+', '-', '*', '/', '==', '<', etc.
@@ -150,7 +153,7 @@ class BinaryOp(Expression):
         return f"BinaryOp({self.left} {self.operator} {self.right})"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class UnaryOp(Expression):
     """一元操作符"""
     operator: str  # '!', '-'
@@ -160,18 +163,18 @@ class UnaryOp(Expression):
         return f"UnaryOp({self.operator}{self.operand})"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class FunctionCall(Expression):
     """函数调用"""
     name: str
-    arguments: List[Expression]
+    arguments: list[Expression]
 
     def __repr__(self):
         args = ', '.join(str(arg) for arg in self.arguments)
         return f"FunctionCall({self.name}({args}))"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class IfExpression(Expression):
     """条件表达式"""
     condition: Expression
@@ -182,10 +185,10 @@ class IfExpression(Expression):
         return f"If({self.condition}) Then({self.then_branch}) Else({self.else_branch})"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class Lambda(Expression):
     """Lambda 表达式"""
-    parameters: List[str]
+    parameters: list[str]
     body: Expression
 
     def __repr__(self):
@@ -193,7 +196,7 @@ class Lambda(Expression):
         return f"Lambda(({params}) => {self.body})"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class LetExpression(Expression):
     """Let 表达式：let name = value in body"""
     name: str
@@ -206,7 +209,7 @@ class LetExpression(Expression):
 
 # ================== 流操作符节点 ==================
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class PreOp(Expression):
     """Pre 操作符：访问流的前一时刻值"""
     stream_name: str
@@ -216,7 +219,7 @@ class PreOp(Expression):
         return f"pre({self.stream_name}, {self.initial_value})"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class FoldOp(Expression):
     """Fold 操作符：状态累积"""
     stream: Expression
@@ -229,7 +232,7 @@ class FoldOp(Expression):
 
 # ================== 数组操作符节点 ==================
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class MapOp(Expression):
     """Map 操作符：映射数组元素"""
     array: Expression
@@ -239,7 +242,7 @@ class MapOp(Expression):
         return f"map({self.array}, {self.mapper})"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class FilterOp(Expression):
     """Filter 操作符：过滤数组元素"""
     array: Expression
@@ -249,7 +252,7 @@ class FilterOp(Expression):
         return f"filter({self.array}, {self.predicate})"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class ReduceOp(Expression):
     """Reduce 操作符：归约数组"""
     array: Expression
@@ -262,13 +265,12 @@ class ReduceOp(Expression):
 
 # ================== 声明节点 ==================
 
-@dataclass
 class Statement(ASTNode):
     """语句节点基类"""
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(slots=True, eq=False, repr=False)
 class SourceDecl(Statement):
     """源声明：source name : type := initial_value;"""
     name: str
@@ -278,14 +280,14 @@ class SourceDecl(Statement):
     # 用于图构建的元数据
     rank: int = 0  # 拓扑高度
     is_stateful: bool = False
-    static_dependencies: List[str] = field(default_factory=list)
+    static_dependencies: tuple[str, ...] = ()
 
     def __repr__(self):
         init = f" := {self.initial_value}" if self.initial_value else ""
         return f"source {self.name} : {self.type_sig}{init};"
 
 
-@dataclass
+@dataclass(slots=True, eq=False, repr=False)
 class StreamDecl(Statement):
     """流声明：stream name <- expression [on trigger];"""
     name: str
@@ -295,7 +297,7 @@ class StreamDecl(Statement):
     # 用于图构建的元数据
     rank: int = 0  # 拓扑高度
     is_stateful: bool = False
-    static_dependencies: List[str] = field(default_factory=list)
+    static_dependencies: tuple[str, ...] = ()
 
     def __repr__(self):
         if self.trigger:
@@ -303,7 +305,7 @@ class StreamDecl(Statement):
         return f"stream {self.name} <- {self.expression};"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class SinkDecl(Statement):
     """Sink 声明：sink name <- expression;"""
     name: str
@@ -313,11 +315,11 @@ class SinkDecl(Statement):
         return f"sink {self.name} <- {self.expression};"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class FuncDecl(Statement):
     """函数声明：func name(params) = expression;"""
     name: str
-    parameters: List[str]
+    parameters: list[str]
     body: Expression
 
     def __repr__(self):
@@ -325,7 +327,7 @@ class FuncDecl(Statement):
         return f"func {self.name}({params}) = {self.body};"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class TypeDecl(Statement):
     """类型定义：type Point = { x: int, y: int };"""
     name: str
@@ -337,106 +339,159 @@ class TypeDecl(Statement):
 
 # ================== 程序节点 ==================
 
-@dataclass
+@dataclass(slots=True, frozen=True, eq=False, repr=False)
 class Program(ASTNode):
     """程序：顶层声明列表"""
-    statements: List[Statement]
+    statements: list[Statement]
 
     def __repr__(self):
+        # 只给出概要，避免打印/记录日志时意外构造整棵树的字符串
+        return f"Program({len(self.statements)} statements)"
+
+    def pretty(self) -> str:
+        """完整的程序文本表示（逐条语句）"""
         stmts = '\n'.join(str(s) for s in self.statements)
         return f"Program:\n{stmts}"
 
 
 # ================== 工具函数 ==================
 
-def extract_dependencies(expr: Expression, local_vars: set = None) -> List[str]:
-    """从表达式中提取依赖的标识符列表"""
-    if local_vars is None:
-        local_vars = set()
+def _push_lambda_body(lam, scope, stack):
+    """Lambda 体使用扩展的作用域（包含 Lambda 参数）"""
+    if isinstance(lam, Lambda):
+        stack.append((lam.body, scope | frozenset(lam.parameters)))
+
+
+def _deps_identifier(node, scope, stack, deps):
+    # 只有不在局部变量集合中的标识符才是外部依赖
+    if node.name not in scope:
+        deps.append(node.name)
+
+
+def _deps_binary_op(node, scope, stack, deps):
+    stack.append((node.right, scope))
+    stack.append((node.left, scope))
+
+
+def _deps_unary_op(node, scope, stack, deps):
+    stack.append((node.operand, scope))
+
+
+def _deps_function_call(node, scope, stack, deps):
+    stack.extend((arg, scope) for arg in reversed(node.arguments))
+
+
+def _deps_if(node, scope, stack, deps):
+    stack.append((node.else_branch, scope))
+    stack.append((node.then_branch, scope))
+    stack.append((node.condition, scope))
+
+
+def _deps_let(node, scope, stack, deps):
+    # body 使用扩展的作用域（包含 let 绑定的变量），value 使用当前作用域
+    stack.append((node.body, scope | {node.name}))
+    stack.append((node.value, scope))
+
+
+def _deps_pre(node, scope, stack, deps):
+    # PreOp 引用的流名不受局部变量影响
+    if node.stream_name not in scope:
+        deps.append(node.stream_name)
+
+
+def _deps_fold(node, scope, stack, deps):
+    _push_lambda_body(node.accumulator, scope, stack)
+    stack.append((node.initial, scope))
+    stack.append((node.stream, scope))
+
+
+def _deps_array_literal(node, scope, stack, deps):
+    stack.extend((elem, scope) for elem in reversed(node.elements))
+
+
+def _deps_array_access(node, scope, stack, deps):
+    stack.append((node.index, scope))
+    stack.append((node.array, scope))
+
+
+def _deps_map(node, scope, stack, deps):
+    _push_lambda_body(node.mapper, scope, stack)
+    stack.append((node.array, scope))
+
+
+def _deps_filter(node, scope, stack, deps):
+    _push_lambda_body(node.predicate, scope, stack)
+    stack.append((node.array, scope))
+
+
+def _deps_reduce(node, scope, stack, deps):
+    _push_lambda_body(node.accumulator, scope, stack)
+    stack.append((node.initial, scope))
+    stack.append((node.array, scope))
+
+
+def _deps_struct_literal(node, scope, stack, deps):
+    stack.extend((value, scope) for _, value in reversed(node.fields))
+
+
+def _deps_field_access(node, scope, stack, deps):
+    # 字段访问：提取完整路径作为依赖，例如 p.x -> 依赖 "p.x"
+    field_path = _get_field_path(node)
+    if field_path and field_path.split('.')[0] not in scope:
+        deps.append(field_path)
+
+
+# 按节点具体类型分派（type(node) 查表，而非 isinstance 链）
+_DEP_HANDLERS = {
+    Identifier: _deps_identifier,
+    BinaryOp: _deps_binary_op,
+    UnaryOp: _deps_unary_op,
+    FunctionCall: _deps_function_call,
+    IfExpression: _deps_if,
+    LetExpression: _deps_let,
+    PreOp: _deps_pre,
+    FoldOp: _deps_fold,
+    # 数组相关节点
+    ArrayLiteral: _deps_array_literal,
+    ArrayAccess: _deps_array_access,
+    MapOp: _deps_map,
+    FilterOp: _deps_filter,
+    ReduceOp: _deps_reduce,
+    # 结构体相关节点
+    StructLiteral: _deps_struct_literal,
+    FieldAccess: _deps_field_access,
+}
+
+
+def extract_dependencies(expr: Expression, local_vars: set = None) -> list[str]:
+    """
+    从表达式中提取依赖的标识符列表（显式栈迭代，避免深层递归）
+
+    无局部变量时的结果记录在节点上：节点冻结、子树在构造后不变，结果随语法树一起释放。
+    子树已有记录时直接复用，局部变量只会排除名称，因此按作用域过滤即可。
+    """
+    scope = frozenset(local_vars) if local_vars else frozenset()
+    if not scope and expr._deps is not None:
+        return list(expr._deps)
 
     dependencies = []
+    stack = [(expr, scope)]
+    handlers = _DEP_HANDLERS
+
+    while stack:
+        node, scope = stack.pop()
+        cached = node._deps
+        if cached is not None:
+            dependencies.extend(dep for dep in cached if dep not in scope)
+            continue
+        handler = handlers.get(type(node))
+        if handler is not None:
+            handler(node, scope, stack, dependencies)
 
-    def visit(node, locals_set):
-        if isinstance(node, Identifier):
-            # 只有不在局部变量集合中的标识符才是外部依赖
-            if node.name not in locals_set:
-                dependencies.append(node.name)
-        elif isinstance(node, BinaryOp):
-            visit(node.left, locals_set)
-            visit(node.right, locals_set)
-        elif isinstance(node, UnaryOp):
-            visit(node.operand, locals_set)
-        elif isinstance(node, FunctionCall):
-            for arg in node.arguments:
-                visit(arg, locals_set)
-        elif isinstance(node, IfExpression):
-            visit(node.condition, locals_set)
-            visit(node.then_branch, locals_set)
-            visit(node.else_branch, locals_set)
-        elif isinstance(node, LetExpression):
-            # let name = value in body
-            # value 使用当前作用域
-            visit(node.value, locals_set)
-            # body 使用扩展的作用域（包含 let 绑定的变量）
-            let_locals = locals_set.copy()
-            let_locals.add(node.name)
-            visit(node.body, let_locals)
-        elif isinstance(node, PreOp):
-            # PreOp 引用的流名不受局部变量影响
-            if node.stream_name not in locals_set:
-                dependencies.append(node.stream_name)
-        elif isinstance(node, FoldOp):
-            # Fold 操作：stream 和 initial 使用当前作用域
-            visit(node.stream, locals_set)
-            visit(node.initial, locals_set)
-
-            # Lambda body 使用扩展的作用域（包含 Lambda 参数）
-            if isinstance(node.accumulator, Lambda):
-                # 创建新的局部变量集合，包含 Lambda 参数
-                lambda_locals = locals_set.copy()
-                lambda_locals.update(node.accumulator.parameters)
-                visit(node.accumulator.body, lambda_locals)
-
-        # 数组相关节点
-        elif isinstance(node, ArrayLiteral):
-            for elem in node.elements:
-                visit(elem, locals_set)
-        elif isinstance(node, ArrayAccess):
-            visit(node.array, locals_set)
-            visit(node.index, locals_set)
-        elif isinstance(node, MapOp):
-            visit(node.array, locals_set)
-            if isinstance(node.mapper, Lambda):
-                lambda_locals = locals_set.copy()
-                lambda_locals.update(node.mapper.parameters)
-                visit(node.mapper.body, lambda_locals)
-        elif isinstance(node, FilterOp):
-            visit(node.array, locals_set)
-            if isinstance(node.predicate, Lambda):
-                lambda_locals = locals_set.copy()
-                lambda_locals.update(node.predicate.parameters)
-                visit(node.predicate.body, lambda_locals)
-        elif isinstance(node, ReduceOp):
-            visit(node.array, locals_set)
-            visit(node.initial, locals_set)
-            if isinstance(node.accumulator, Lambda):
-                lambda_locals = locals_set.copy()
-                lambda_locals.update(node.accumulator.parameters)
-                visit(node.accumulator.body, lambda_locals)
-
-        # 结构体相关节点
-        elif isinstance(node, StructLiteral):
-            for field_expr in node.fields.values():
-                visit(field_expr, locals_set)
-        elif isinstance(node, FieldAccess):
-            # 字段访问：提取完整路径作为依赖
-            # 例如 p.x -> 依赖 "p.x"
-            field_path = _get_field_path(node)
-            if field_path and field_path.split('.')[0] not in locals_set:
-                dependencies.append(field_path)
-
-    visit(expr, local_vars)
-    return list(set(dependencies))  # 去重
+    result = tuple(dict.fromkeys(dependencies))  # 保序去重
+    if not local_vars:
+        object.__setattr__(expr, '_deps', result)
+    return list(result)
 
 
 def _get_field_path(expr: Expression) -> Optional[str]:
@@ -444,7 +499,7 @@ def _get_field_path(expr: Expression) -> Optional[str]:
     if isinstance(expr, FieldAccess):
         base_path = _get_field_path(expr.object)
         if base_path:
-            return f"{base_path}.{expr.field_name}"
+            return sys.intern(f"{base_path}.{expr.field_name}")
         return None
     elif isinstance(expr, Identifier):
         return expr.name
@@ -454,36 +509,35 @@ def _get_field_path(expr: Expression) -> Optional[str]:
 
 def is_stateful_expr(expr: Expression) -> bool:
     """检查表达式是否包含状态操作（pre 或 fold）"""
-    if isinstance(expr, PreOp) or isinstance(expr, FoldOp):
-        return True
-    elif isinstance(expr, BinaryOp):
-        return is_stateful_expr(expr.left) or is_stateful_expr(expr.right)
-    elif isinstance(expr, UnaryOp):
-        return is_stateful_expr(expr.operand)
-    elif isinstance(expr, FunctionCall):
-        return any(is_stateful_expr(arg) for arg in expr.arguments)
-    elif isinstance(expr, IfExpression):
-        return (is_stateful_expr(expr.condition) or
-                is_stateful_expr(expr.then_branch) or
-                is_stateful_expr(expr.else_branch))
-    elif isinstance(expr, LetExpression):
-        return is_stateful_expr(expr.value) or is_stateful_expr(expr.body)
+    return expr._stateful
+
+
+def _compute_stateful(expr: Expression) -> bool:
+    """根据子节点已有的 _stateful 标记计算当前节点的标记"""
+    rule = _STATEFUL_RULES.get(type(expr))
+    return rule(expr) if rule is not None else False
+
+
+# 按节点具体类型分派的状态标记规则（子节点的 _stateful 已在构造时计算）
+_STATEFUL_RULES = {
+    PreOp: lambda e: True,
+    FoldOp: lambda e: True,
+    BinaryOp: lambda e: e.left._stateful or e.right._stateful,
+    UnaryOp: lambda e: e.operand._stateful,
+    FunctionCall: lambda e: any(arg._stateful for arg in e.arguments),
+    IfExpression: lambda e: (e.condition._stateful or
+                             e.then_branch._stateful or
+                             e.else_branch._stateful),
+    LetExpression: lambda e: e.value._stateful or e.body._stateful,
     # 数组相关节点
-    elif isinstance(expr, ArrayLiteral):
-        return any(is_stateful_expr(elem) for elem in expr.elements)
-    elif isinstance(expr, ArrayAccess):
-        return is_stateful_expr(expr.array) or is_stateful_expr(expr.index)
-    elif isinstance(expr, MapOp):
-        return is_stateful_expr(expr.array) or is_stateful_expr(expr.mapper.body)
-    elif isinstance(expr, FilterOp):
-        return is_stateful_expr(expr.array) or is_stateful_expr(expr.predicate.body)
-    elif isinstance(expr, ReduceOp):
-        return (is_stateful_expr(expr.array) or
-                is_stateful_expr(expr.initial) or
-                is_stateful_expr(expr.accumulator.body))
+    ArrayLiteral: lambda e: any(elem._stateful for elem in e.elements),
+    ArrayAccess: lambda e: e.array._stateful or e.index._stateful,
+    MapOp: lambda e: e.array._stateful or e.mapper.body._stateful,
+    FilterOp: lambda e: e.array._stateful or e.predicate.body._stateful,
+    ReduceOp: lambda e: (e.array._stateful or
+                         e.initial._stateful or
+                         e.accumulator.body._stateful),
     # 结构体相关节点
-    elif isinstance(expr, StructLiteral):
-        return any(is_stateful_expr(v) for v in expr.fields.values())
-    elif isinstance(expr, FieldAccess):
-        return is_stateful_expr(expr.object)
-    return False
+    StructLiteral: lambda e: any(v._stateful for _, v in e.fields),
+    FieldAccess: lambda e: e.object._stateful,
+}
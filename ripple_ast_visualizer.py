@@ -3,7 +3,10 @@ Ripple Language - AST 可视化器
 支持多种输出格式：ASCII 树、DOT (Graphviz)、JSON
 """
 
-from typing import Any, List, Optional
+import io
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Iterator, List, Optional, TextIO
 from ripple_ast import (
     ASTNode, Program, Statement, Expression, TypeNode,
     # 类型节点
@@ -19,19 +22,135 @@ from ripple_ast import (
 import json
 
 
+# 每种节点的子字段：(显示名, 属性名, 种类)，在导入时构建一次
+#   node  - 单个子节点（可能为 None）
+#   opt   - 可选子节点，为空时省略
+#   list  - 子节点列表
+#   dict  - 字段名 -> 子节点 的映射
+#   pairs - (字段名, 子节点) 元组序列，按 dict 处理
+#   value - 基本值
+_CHILD_FIELDS = {
+    Program: (("statements", "statements", "list"),),
+    SourceDecl: (("type", "type_sig", "opt"), ("initial", "initial_value", "opt")),
+    StreamDecl: (("expr", "expression", "node"),),
+    SinkDecl: (("expr", "expression", "node"),),
+    FuncDecl: (("body", "body", "node"),),
+    TypeDecl: (("def", "type_def", "node"),),
+    BinaryOp: (("left", "left", "node"), ("right", "right", "node")),
+    UnaryOp: (("operand", "operand", "node"),),
+    FunctionCall: (("args", "arguments", "list"),),
+    IfExpression: (("cond", "condition", "node"), ("then", "then_branch", "node"),
+                   ("else", "else_branch", "node")),
+    LetExpression: (("value", "value", "node"), ("body", "body", "node")),
+    Lambda: (("body", "body", "node"),),
+    PreOp: (("stream", "stream_name", "value"), ("initial", "initial_value", "node")),
+    FoldOp: (("init", "initial_value", "node"), ("accum", "accumulator", "node")),
+    MapOp: (("array", "array", "node"), ("mapper", "mapper", "node")),
+    FilterOp: (("array", "array", "node"), ("predicate", "predicate", "node")),
+    ReduceOp: (("array", "array", "node"), ("init", "initial", "node"), ("accum", "accumulator", "node")),
+    ArrayLiteral: (("elements", "elements", "list"),),
+    ArrayAccess: (("array", "array", "node"), ("index", "index", "node")),
+    StructLiteral: (("fields", "fields", "pairs"),),
+    FieldAccess: (("object", "object", "node"),),
+    ArrayType: (("element", "element_type", "node"),),
+    StructType: (("fields", "fields", "dict"),),
+    FunctionType: (("params", "param_types", "list"), ("return", "return_type", "node")),
+}
+# 由 _CHILD_FIELDS 预先构建的访问描述：(显示名, 属性读取器, 种类)；pairs 直接视为 fields
+_CHILD_SPECS = {
+    cls: tuple((name, attrgetter(attr), "fields" if kind == "pairs" else kind)
+               for name, attr, kind in fields)
+    for cls, fields in _CHILD_FIELDS.items()
+}
+
+# 节点标签构造函数，按具体类型查表；未列出的类型只显示类名
+_LABEL_BUILDERS = {
+    Literal: lambda n: f"Literal({n.value}, {n.type_name})",
+    Identifier: lambda n: f"Identifier({n.name})",
+    BinaryOp: lambda n: f"BinaryOp({n.operator})",
+    UnaryOp: lambda n: f"UnaryOp({n.operator})",
+    SourceDecl: lambda n: f"SourceDecl({n.name})",
+    StreamDecl: lambda n: f"StreamDecl({n.name}{f', on={n.trigger}' if n.trigger else ''})",
+    SinkDecl: lambda n: f"SinkDecl({n.name})",
+    FuncDecl: lambda n: f"FuncDecl({n.name}({', '.join(n.parameters)}))",
+    TypeDecl: lambda n: f"TypeDecl({n.name})",
+    FunctionCall: lambda n: f"FunctionCall({n.name})",
+    FieldAccess: lambda n: f"FieldAccess(.{n.field_name})",
+    Lambda: lambda n: f"Lambda(({', '.join(n.parameters)}) => ...)",
+    BasicType: lambda n: f"BasicType({n.name})",
+    StructType: lambda n: f"StructType({{{', '.join(n.fields.keys())}}})",
+}
+
+# DOT 节点颜色，按具体类型查表
+_DOT_COLORS = {
+    Program: "#E8E8E8",  # 灰色 - 程序根节点
+    # 浅蓝 - 声明节点
+    SourceDecl: "#B3E5FC", StreamDecl: "#B3E5FC", SinkDecl: "#B3E5FC",
+    # 浅绿 - 定义节点
+    FuncDecl: "#C8E6C9", TypeDecl: "#C8E6C9",
+    # 浅橙 - 运算符
+    BinaryOp: "#FFE0B2", UnaryOp: "#FFE0B2",
+    # 浅黄 - 叶子节点
+    Literal: "#FFF9C4", Identifier: "#FFF9C4",
+    # 浅紫 - 控制流
+    IfExpression: "#E1BEE7", LetExpression: "#E1BEE7",
+    # 浅红 - 时序操作
+    PreOp: "#FFCDD2", FoldOp: "#FFCDD2",
+    # 浅青 - 高阶操作
+    MapOp: "#B2DFDB", FilterOp: "#B2DFDB", ReduceOp: "#B2DFDB",
+    # 浅棕 - 类型节点
+    BasicType: "#D7CCC8", ArrayType: "#D7CCC8", StructType: "#D7CCC8",
+}
+
+# 树形图连接符与子节点缩进，以“是否最后一个”（False/True）为下标
+_CONN = ("├── ", "└── ")
+_CHILD_PAD = ("│   ", "    ")
+
+# 常见基本类型叶子值的格式化函数（与 repr 输出一致）；其余类型回退到 repr
+_fmt_leaf = {int: str, float: str, bool: str}.get
+
+# 可共享 JSON 字典的叶子节点的结构键；Literal 键中带上值的类型，避免 1 / 1.0 / True 相互混淆
+_LEAF_KEYS = {
+    Literal: lambda n: (Literal, type(n.value), n.value, n.type_name),
+    Identifier: lambda n: (Identifier, n.name),
+    BasicType: lambda n: (BasicType, n.name),
+}
+
+# JSON 输出中的额外属性：类型 -> ((键, 属性名), ...)
+_JSON_ATTRS = {
+    Literal: (("value", "value"), ("literal_type", "type_name")),
+    Identifier: (("name", "name"),),
+    BinaryOp: (("operator", "operator"),),
+    UnaryOp: (("operator", "operator"),),
+    SourceDecl: (("name", "name"),),
+    StreamDecl: (("name", "name"), ("trigger", "trigger")),
+    SinkDecl: (("name", "name"),),
+    FuncDecl: (("name", "name"), ("parameters", "parameters")),
+    TypeDecl: (("name", "name"),),
+    FunctionCall: (("name", "name"),),
+    FieldAccess: (("field", "field_name"),),
+    Lambda: (("parameters", "parameters"),),
+    LetExpression: (("var_name", "name"),),
+    BasicType: (("type_name", "name"),),
+}
+
+
 class ASTVisualizer:
     """AST 可视化器"""
 
     def __init__(self):
         self.node_counter = 0
+        # JSON 叶子节点字典缓存：结构相同的叶子共享同一个（只读的）字典
+        self._dict_cache: dict[tuple, dict] = {}
 
-    def visualize(self, node: ASTNode, format: str = "tree") -> str:
+    def visualize(self, node: ASTNode, format: str = "tree", indent: Optional[int] = 2) -> str:
         """
         可视化 AST
 
         Args:
             node: AST 节点
             format: 输出格式 - "tree" (ASCII), "dot" (Graphviz), "json"
+            indent: JSON 缩进；为 None 时输出紧凑 JSON（供程序读取）
 
         Returns:
             可视化字符串
@@ -41,239 +160,155 @@ class ASTVisualizer:
         elif format == "dot":
             return self._to_dot(node)
         elif format == "json":
-            return self._to_json(node)
+            return self._to_json(node, indent)
         else:
             raise ValueError(f"Unknown format: {format}")
 
     # ==================== ASCII Tree ====================
 
     def _to_tree(self, node: ASTNode, prefix: str = "", is_last: bool = True) -> str:
-        """生成 ASCII 树形图"""
+        """生成 ASCII 树形图（显式栈迭代，所有行写入同一个缓冲区，最后只 join 一次）"""
         lines = []
+        # 栈元素：(节点, 前缀, 是否最后一个) 表示待展开的子树；str 表示直接输出的行
+        stack: List[Any] = [(node, prefix, is_last)]
 
-        # 当前节点的连接符
-        connector = "└── " if is_last else "├── "
-
-        # 节点标签
-        label = self._get_node_label(node)
-        lines.append(prefix + connector + label)
-
-        # 子节点的前缀
-        child_prefix = prefix + ("    " if is_last else "│   ")
-
-        # 获取子节点
-        children = self._get_children(node)
-
-        for i, (child_name, child_node) in enumerate(children):
-            is_last_child = (i == len(children) - 1)
-
-            if child_node is None:
-                lines.append(child_prefix + ("└── " if is_last_child else "├── ") + f"{child_name}: None")
-            elif isinstance(child_node, list):
-                # 列表类型的子节点
-                list_connector = "└── " if is_last_child else "├── "
-                lines.append(child_prefix + list_connector + f"{child_name}: [{len(child_node)} items]")
-                list_prefix = child_prefix + ("    " if is_last_child else "│   ")
-                for j, item in enumerate(child_node):
-                    is_last_item = (j == len(child_node) - 1)
-                    if isinstance(item, ASTNode):
-                        lines.append(self._to_tree(item, list_prefix, is_last_item))
-                    else:
-                        item_connector = "└── " if is_last_item else "├── "
-                        lines.append(list_prefix + item_connector + repr(item))
-            elif isinstance(child_node, dict):
-                # 字典类型的子节点
-                dict_connector = "└── " if is_last_child else "├── "
-                lines.append(child_prefix + dict_connector + f"{child_name}: {{{len(child_node)} fields}}")
-                dict_prefix = child_prefix + ("    " if is_last_child else "│   ")
-                items = list(child_node.items())
-                for j, (key, value) in enumerate(items):
-                    is_last_item = (j == len(items) - 1)
-                    item_connector = "└── " if is_last_item else "├── "
-                    if isinstance(value, ASTNode):
-                        lines.append(dict_prefix + item_connector + f"{key}:")
-                        inner_prefix = dict_prefix + ("    " if is_last_item else "│   ")
-                        lines.append(self._to_tree(value, inner_prefix, True))
-                    else:
-                        lines.append(dict_prefix + item_connector + f"{key}: {repr(value)}")
-            elif isinstance(child_node, ASTNode):
-                lines.append(child_prefix + ("└── " if is_last_child else "├── ") + f"{child_name}:")
-                inner_prefix = child_prefix + ("    " if is_last_child else "│   ")
-                lines.append(self._to_tree(child_node, inner_prefix, True))
-            else:
-                # 基本类型
-                child_connector = "└── " if is_last_child else "├── "
-                lines.append(child_prefix + child_connector + f"{child_name}: {repr(child_node)}")
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                lines.append(item)
+                continue
+            node, prefix, is_last = item
+
+            # 当前节点的连接符与标签
+            connector = _CONN[is_last]
+            lines.append(prefix + connector + self._get_node_label(node))
+
+            # 子节点的前缀
+            child_prefix = prefix + _CHILD_PAD[is_last]
+
+            # 按输出顺序收集子节点的工作项，再逆序压栈
+            work = []
+            children = list(self._iter_children(node))
+            for i, (child_name, child_node, kind) in enumerate(children):
+                is_last_child = (i == len(children) - 1)
+                child_connector = _CONN[is_last_child]
+                inner_prefix = child_prefix + _CHILD_PAD[is_last_child]
+
+                if child_node is None:
+                    work.append(child_prefix + child_connector + f"{child_name}: None")
+                elif kind == "list":
+                    # 列表类型的子节点
+                    work.append(child_prefix + child_connector + f"{child_name}: [{len(child_node)} items]")
+                    for j, elem in enumerate(child_node):
+                        work.append((elem, inner_prefix, j == len(child_node) - 1))
+                elif kind == "fields":
+                    # 字典类型的子节点
+                    work.append(child_prefix + child_connector + f"{child_name}: {{{len(child_node)} fields}}")
+                    for j, (key, value) in enumerate(child_node):
+                        is_last_item = (j == len(child_node) - 1)
+                        item_connector = _CONN[is_last_item]
+                        work.append(inner_prefix + item_connector + f"{key}:")
+                        work.append((value, inner_prefix + _CHILD_PAD[is_last_item], True))
+                elif kind == "node":
+                    work.append(child_prefix + child_connector + f"{child_name}:")
+                    work.append((child_node, inner_prefix, True))
+                else:
+                    # 基本类型
+                    fmt = _fmt_leaf(type(child_node), repr)
+                    work.append(child_prefix + child_connector + f"{child_name}: {fmt(child_node)}")
+
+            stack.extend(reversed(work))
 
         return "\n".join(lines)
 
     def _get_node_label(self, node: ASTNode) -> str:
-        """获取节点标签"""
-        class_name = node.__class__.__name__
-
-        # 为不同节点类型添加关键信息
-        if isinstance(node, Literal):
-            return f"{class_name}({node.value}, {node.type_name})"
-        elif isinstance(node, Identifier):
-            return f"{class_name}({node.name})"
-        elif isinstance(node, BinaryOp):
-            return f"{class_name}({node.operator})"
-        elif isinstance(node, UnaryOp):
-            return f"{class_name}({node.operator})"
-        elif isinstance(node, SourceDecl):
-            return f"{class_name}({node.name})"
-        elif isinstance(node, StreamDecl):
-            trigger_info = f", on={node.trigger}" if node.trigger else ""
-            return f"{class_name}({node.name}{trigger_info})"
-        elif isinstance(node, SinkDecl):
-            return f"{class_name}({node.name})"
-        elif isinstance(node, FuncDecl):
-            params = ", ".join(node.parameters)
-            return f"{class_name}({node.name}({params}))"
-        elif isinstance(node, TypeDecl):
-            return f"{class_name}({node.name})"
-        elif isinstance(node, FunctionCall):
-            return f"{class_name}({node.name})"
-        elif isinstance(node, FieldAccess):
-            return f"{class_name}(.{node.field_name})"
-        elif isinstance(node, Lambda):
-            params = ", ".join(node.parameters)
-            return f"{class_name}(({params}) => ...)"
-        elif isinstance(node, PreOp):
-            return f"{class_name}"
-        elif isinstance(node, FoldOp):
-            return f"{class_name}"
-        elif isinstance(node, BasicType):
-            return f"{class_name}({node.name})"
-        elif isinstance(node, ArrayType):
-            return f"{class_name}"
-        elif isinstance(node, StructType):
-            fields = ", ".join(node.fields.keys())
-            return f"{class_name}({{{fields}}})"
-        else:
-            return class_name
-
-    def _get_children(self, node: ASTNode) -> List[tuple]:
-        """获取节点的子节点列表，返回 (名称, 节点) 元组列表"""
-        children = []
-
-        if isinstance(node, Program):
-            children.append(("statements", node.statements))
-        elif isinstance(node, SourceDecl):
-            if node.type_sig:
-                children.append(("type", node.type_sig))
-            if node.initial_value:
-                children.append(("initial", node.initial_value))
-        elif isinstance(node, StreamDecl):
-            children.append(("expr", node.expression))
-        elif isinstance(node, SinkDecl):
-            children.append(("expr", node.expression))
-        elif isinstance(node, FuncDecl):
-            children.append(("body", node.body))
-        elif isinstance(node, TypeDecl):
-            children.append(("def", node.type_def))
-        elif isinstance(node, BinaryOp):
-            children.append(("left", node.left))
-            children.append(("right", node.right))
-        elif isinstance(node, UnaryOp):
-            children.append(("operand", node.operand))
-        elif isinstance(node, FunctionCall):
-            children.append(("args", node.arguments))
-        elif isinstance(node, IfExpression):
-            children.append(("cond", node.condition))
-            children.append(("then", node.then_branch))
-            children.append(("else", node.else_branch))
-        elif isinstance(node, LetExpression):
-            children.append(("value", node.value))
-            children.append(("body", node.body))
-        elif isinstance(node, Lambda):
-            children.append(("body", node.body))
-        elif isinstance(node, PreOp):
-            children.append(("stream", node.stream_name))
-            children.append(("initial", node.initial_value))
-        elif isinstance(node, FoldOp):
-            children.append(("init", node.initial_value))
-            children.append(("accum", node.accumulator))
-        elif isinstance(node, MapOp):
-            children.append(("array", node.array))
-            children.append(("mapper", node.mapper))
-        elif isinstance(node, FilterOp):
-            children.append(("array", node.array))
-            children.append(("predicate", node.predicate))
-        elif isinstance(node, ReduceOp):
-            children.append(("array", node.array))
-            children.append(("init", node.initial))
-            children.append(("accum", node.accumulator))
-        elif isinstance(node, ArrayLiteral):
-            children.append(("elements", node.elements))
-        elif isinstance(node, ArrayAccess):
-            children.append(("array", node.array))
-            children.append(("index", node.index))
-        elif isinstance(node, StructLiteral):
-            children.append(("fields", node.fields))
-        elif isinstance(node, FieldAccess):
-            children.append(("object", node.object))
-        elif isinstance(node, ArrayType):
-            children.append(("element", node.element_type))
-        elif isinstance(node, StructType):
-            children.append(("fields", node.fields))
-        elif isinstance(node, FunctionType):
-            children.append(("params", node.param_types))
-            children.append(("return", node.return_type))
-
-        return children
-
-    # ==================== DOT (Graphviz) ====================
+        """获取节点标签（为不同节点类型添加关键信息）"""
+        builder = _LABEL_BUILDERS.get(type(node))
+        if builder is None:
+            return node.__class__.__name__
+        return builder(node)
 
-    def _to_dot(self, node: ASTNode) -> str:
-        """生成 DOT 格式（用于 Graphviz）"""
-        self.node_counter = 0
-        lines = [
-            "digraph AST {",
-            "    node [shape=box, fontname=\"Courier\"];",
-            "    edge [fontname=\"Courier\", fontsize=10];",
-            ""
-        ]
-
-        self._add_dot_node(node, lines)
+    def _iter_children(self, node: ASTNode) -> Iterator[tuple]:
+        """
+        依次产出节点的子节点 (名称, 值, 种类)，不构造中间列表
 
-        lines.append("}")
-        return "\n".join(lines)
+        种类为 "node" / "list" / "fields" / "value"；"fields" 的值是 (键, 子节点) 序列
+        """
+        for child_name, getter, kind in _CHILD_SPECS.get(type(node), ()):
+            value = getter(node)
+            if kind == "opt":
+                if not value:
+                    continue
+                kind = "node"
+            elif kind == "dict":
+                value, kind = tuple(value.items()), "fields"
+            yield child_name, value, kind
 
-    def _add_dot_node(self, node: ASTNode, lines: List[str], parent_id: Optional[int] = None, edge_label: str = "") -> int:
-        """递归添加 DOT 节点"""
-        node_id = self.node_counter
-        self.node_counter += 1
+    # ==================== DOT (Graphviz) ====================
 
-        # 节点标签
-        label = self._get_dot_label(node)
-        color = self._get_dot_color(node)
-        lines.append(f'    n{node_id} [label="{label}", fillcolor="{color}", style="filled"];')
+    def _to_dot(self, node: ASTNode, out: Optional[TextIO] = None) -> Optional[str]:
+        """
+        生成 DOT 格式（用于 Graphviz）
 
-        # 连接到父节点
-        if parent_id is not None:
-            if edge_label:
-                lines.append(f'    n{parent_id} -> n{node_id} [label="{edge_label}"];')
-            else:
-                lines.append(f'    n{parent_id} -> n{node_id};')
+        Args:
+            node: AST 节点
+            out: 输出流；为 None 时写入内部缓冲区并返回字符串
 
-        # 处理子节点
-        children = self._get_children(node)
-        for child_name, child_node in children:
-            if child_node is None:
-                continue
-            elif isinstance(child_node, list):
-                for i, item in enumerate(child_node):
-                    if isinstance(item, ASTNode):
-                        self._add_dot_node(item, lines, node_id, f"{child_name}[{i}]")
-            elif isinstance(child_node, dict):
-                for key, value in child_node.items():
-                    if isinstance(value, ASTNode):
-                        self._add_dot_node(value, lines, node_id, f"{child_name}.{key}")
-            elif isinstance(child_node, ASTNode):
-                self._add_dot_node(child_node, lines, node_id, child_name)
-
-        return node_id
+        Returns:
+            未指定 out 时返回 DOT 文本，否则直接写入 out 并返回 None
+        """
+        buffer = io.StringIO() if out is None else out
+        self.node_counter = 0
+        buffer.write(
+            "digraph AST {\n"
+            "    node [shape=box, fontname=\"Courier\"];\n"
+            "    edge [fontname=\"Courier\", fontsize=10];\n"
+            "\n"
+        )
+
+        self._add_dot_node(node, buffer)
+
+        buffer.write("}")
+        return buffer.getvalue() if out is None else None
+
+    def _add_dot_node(self, node: ASTNode, out: TextIO, parent_id: Optional[int] = None, edge_label: str = "") -> int:
+        """添加 DOT 节点及其子树（显式栈迭代，编号与前序遍历一致，逐行写入 out）"""
+        root_id = self.node_counter
+        stack = [(node, parent_id, edge_label)]
+
+        while stack:
+            node, parent_id, edge_label = stack.pop()
+            node_id = self.node_counter
+            self.node_counter += 1
+
+            # 节点标签
+            label = self._get_dot_label(node)
+            color = self._get_dot_color(node)
+            out.write(f'    n{node_id} [label="{label}", fillcolor="{color}", style="filled"];\n')
+
+            # 连接到父节点
+            if parent_id is not None:
+                if edge_label:
+                    out.write(f'    n{parent_id} -> n{node_id} [label="{edge_label}"];\n')
+                else:
+                    out.write(f'    n{parent_id} -> n{node_id};\n')
+
+            # 处理子节点（逆序压栈以保持从左到右的访问顺序）
+            work = []
+            for child_name, child_node, kind in self._iter_children(node):
+                if child_node is None:
+                    continue
+                elif kind == "list":
+                    for i, item in enumerate(child_node):
+                        work.append((item, node_id, f"{child_name}[{i}]"))
+                elif kind == "fields":
+                    for key, value in child_node:
+                        work.append((value, node_id, f"{child_name}.{key}"))
+                elif kind == "node":
+                    work.append((child_node, node_id, child_name))
+            stack.extend(reversed(work))
+
+        return root_id
 
     def _get_dot_label(self, node: ASTNode) -> str:
         """获取 DOT 节点标签"""
@@ -283,103 +318,71 @@ class ASTVisualizer:
 
     def _get_dot_color(self, node: ASTNode) -> str:
         """获取节点颜色"""
-        if isinstance(node, (Program,)):
-            return "#E8E8E8"  # 灰色 - 程序根节点
-        elif isinstance(node, (SourceDecl, StreamDecl, SinkDecl)):
-            return "#B3E5FC"  # 浅蓝 - 声明节点
-        elif isinstance(node, (FuncDecl, TypeDecl)):
-            return "#C8E6C9"  # 浅绿 - 定义节点
-        elif isinstance(node, (BinaryOp, UnaryOp)):
-            return "#FFE0B2"  # 浅橙 - 运算符
-        elif isinstance(node, (Literal, Identifier)):
-            return "#FFF9C4"  # 浅黄 - 叶子节点
-        elif isinstance(node, (IfExpression, LetExpression)):
-            return "#E1BEE7"  # 浅紫 - 控制流
-        elif isinstance(node, (PreOp, FoldOp)):
-            return "#FFCDD2"  # 浅红 - 时序操作
-        elif isinstance(node, (MapOp, FilterOp, ReduceOp)):
-            return "#B2DFDB"  # 浅青 - 高阶操作
-        elif isinstance(node, (BasicType, ArrayType, StructType)):
-            return "#D7CCC8"  # 浅棕 - 类型节点
-        else:
-            return "#FFFFFF"  # 白色 - 默认
+        return _DOT_COLORS.get(type(node), "#FFFFFF")  # 白色 - 默认
 
     # ==================== JSON ====================
 
-    def _to_json(self, node: ASTNode) -> str:
-        """生成 JSON 格式"""
-        return json.dumps(self._node_to_dict(node), indent=2, ensure_ascii=False)
+    def _to_json(self, node: ASTNode, indent: Optional[int] = 2) -> str:
+        """生成 JSON 格式（indent 为 None 时使用紧凑分隔符）"""
+        self._dict_cache.clear()
+        data = self._node_to_dict(node)
+        if indent is None:
+            return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        return json.dumps(data, indent=indent, ensure_ascii=False)
 
     def _node_to_dict(self, node: ASTNode) -> dict:
         """将节点转换为字典"""
+        key_fn = _LEAF_KEYS.get(type(node))
+        if key_fn is not None:
+            key = key_fn(node)
+            cached = self._dict_cache.get(key)
+            if cached is None:
+                cached = self._dict_cache[key] = self._build_node_dict(node)
+            return cached
+        return self._build_node_dict(node)
+
+    def _build_node_dict(self, node: ASTNode) -> dict:
+        """构造节点字典"""
         result = {"_type": node.__class__.__name__}
 
-        children = self._get_children(node)
-        for child_name, child_node in children:
+        for child_name, child_node, kind in self._iter_children(node):
             if child_node is None:
                 result[child_name] = None
-            elif isinstance(child_node, list):
-                result[child_name] = [
-                    self._node_to_dict(item) if isinstance(item, ASTNode) else item
-                    for item in child_node
-                ]
-            elif isinstance(child_node, dict):
-                result[child_name] = {
-                    key: self._node_to_dict(value) if isinstance(value, ASTNode) else value
-                    for key, value in child_node.items()
-                }
-            elif isinstance(child_node, ASTNode):
+            elif kind == "list":
+                result[child_name] = [self._node_to_dict(item) for item in child_node]
+            elif kind == "fields":
+                result[child_name] = {key: self._node_to_dict(value) for key, value in child_node}
+            elif kind == "node":
                 result[child_name] = self._node_to_dict(child_node)
             else:
                 result[child_name] = child_node
 
         # 添加额外属性
-        if isinstance(node, Literal):
-            result["value"] = node.value
-            result["literal_type"] = node.type_name
-        elif isinstance(node, Identifier):
-            result["name"] = node.name
-        elif isinstance(node, BinaryOp):
-            result["operator"] = node.operator
-        elif isinstance(node, UnaryOp):
-            result["operator"] = node.operator
-        elif isinstance(node, SourceDecl):
-            result["name"] = node.name
-        elif isinstance(node, StreamDecl):
-            result["name"] = node.name
-            result["trigger"] = node.trigger
-        elif isinstance(node, SinkDecl):
-            result["name"] = node.name
-        elif isinstance(node, FuncDecl):
-            result["name"] = node.name
-            result["parameters"] = node.parameters
-        elif isinstance(node, TypeDecl):
-            result["name"] = node.name
-        elif isinstance(node, FunctionCall):
-            result["name"] = node.name
-        elif isinstance(node, FieldAccess):
-            result["field"] = node.field_name
-        elif isinstance(node, Lambda):
-            result["parameters"] = node.parameters
-        elif isinstance(node, LetExpression):
-            result["var_name"] = node.name
-        elif isinstance(node, BasicType):
-            result["type_name"] = node.name
+        for key, attr in _JSON_ATTRS.get(type(node), ()):
+            result[key] = getattr(node, attr)
 
         return result
 
 
-def visualize_ast(code: str, format: str = "tree") -> str:
+def visualize_ast(code: str, format: str = "tree", indent: Optional[int] = 2) -> str:
     """
     可视化 Ripple 代码的 AST
 
     Args:
         code: Ripple 源代码
         format: 输出格式 - "tree", "dot", "json"
+        indent: JSON 缩进；为 None 时输出紧凑 JSON
 
     Returns:
         可视化字符串
     """
+    visualizer = ASTVisualizer()
+    return visualizer.visualize(_parse(code), format, indent)
+
+
+@lru_cache(maxsize=16)
+def _parse(code: str) -> Program:
+    """词法分析并解析 Ripple 源代码（按源码缓存，切换输出格式时不重复解析；可视化不修改 AST）"""
     from ripple_lexer import RippleLexer
     from ripple_parser import RippleParser
 
@@ -387,17 +390,15 @@ def visualize_ast(code: str, format: str = "tree") -> str:
     tokens = lexer.tokenize()
 
     parser = RippleParser(tokens)
-    ast = parser.parse()
-
-    visualizer = ASTVisualizer()
-    return visualizer.visualize(ast, format)
+    return parser.parse()
 
 
 def save_dot_file(code: str, output_path: str):
     """保存 DOT 文件，可用 Graphviz 渲染"""
-    dot_content = visualize_ast(code, "dot")
+    ast = _parse(code)
     with open(output_path, 'w') as f:
-        f.write(dot_content)
+        # 直接写入文件，不在内存中拼接完整的 DOT 文本
+        ASTVisualizer()._to_dot(ast, f)
     print(f"DOT 文件已保存到: {output_path}")
     print(f"使用以下命令渲染: dot -Tpng {output_path} -o ast.png")
 
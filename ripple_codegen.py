@@ -0,0 +1,696 @@
+"""
+Ripple Language - Code Generator (代码生成器)
+将纯表达式编译为专用的 Python 函数，避免每次事件都解释遍历 AST
+"""
+
+import math
+import operator
+from functools import reduce
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from ripple_ast import *
+from ripple_ast import _get_field_path
+
+
+class UnsupportedExpression(Exception):
+    """表达式包含代码生成器尚不支持的节点"""
+    pass
+
+
+def _div(l, r):
+    """除法：除数为 0 时返回 inf"""
+    return l / r if r != 0 else float('inf')
+
+
+def _and(l, r):
+    # 两侧都已求值（&& / || 不短路）
+    return l and r
+
+
+def _or(l, r):
+    return l or r
+
+
+def _index(array, index):
+    """数组下标访问（与解释器相同的类型与越界检查，不支持负下标）"""
+    if not isinstance(array, list):
+        raise ValueError(f"Cannot index non-array type: {type(array)}")
+    if not isinstance(index, int):
+        raise ValueError(f"Array index must be int, got: {type(index)}")
+    if index < 0 or index >= len(array):
+        raise IndexError(f"Array index {index} out of bounds (length={len(array)})")
+    return array[index]
+
+
+def _field(obj, field_name):
+    """结构体字段访问（与解释器相同的检查）"""
+    if not isinstance(obj, dict):
+        raise ValueError(f"Cannot access field on non-struct type: {type(obj)}")
+    if field_name not in obj:
+        raise ValueError(f"Struct has no field '{field_name}'")
+    return obj[field_name]
+
+
+def _array(value, op):
+    """map / filter / reduce 的数组参数检查（与解释器相同）"""
+    if not isinstance(value, list):
+        raise ValueError(f"{op} expects array, got: {type(value)}")
+    return value
+
+
+_ENV = object()  # _path 的哨兵：根值从 env 中读取；也用于标记 env 中没有该路径
+
+
+def _path(env, path, root=_ENV):
+    """
+    按字段路径取值：完整路径（如展开的结构体源 p.x）在 env 中时直接读取，
+    否则逐级回退到上一级路径再访问字段，与解释器的查找顺序一致
+    """
+    value = env.get(path, _ENV)
+    if value is not _ENV:
+        return value
+    base, _, field_name = path.rpartition('.')
+    if '.' in base:
+        obj = _path(env, base, root)
+    else:
+        obj = env[base] if root is _ENV else root
+    return _field(obj, field_name)
+
+
+# 操作符语义表（解释器、常量折叠与生成代码共用）
+BINARY_OPS: Dict[str, Callable[[Any, Any], Any]] = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': _div,
+    '%': operator.mod,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '&&': _and,
+    '||': _or,
+}
+
+UNARY_OPS: Dict[str, Callable[[Any], Any]] = {
+    '!': operator.not_,
+    '-': operator.neg,
+}
+
+
+# 生成代码可见的全局名称
+_RUNTIME_GLOBALS: Dict[str, Any] = {
+    '__builtins__': {},
+    '_div': _div,
+    '_and': _and,
+    '_or': _or,
+    '_index': _index,
+    '_field': _field,
+    '_path': _path,
+    '_array': _array,
+    '_reduce': reduce,
+}
+
+# 绑定变量（Lambda 参数、let、map/filter/reduce 的元素）对应的局部变量名前缀（a0, a1, ...）；依赖为 v0, v1, ...
+_PARAM_PREFIX = 'a'
+
+# 直接映射到 Python 中缀运算符的二元操作符
+_INFIX_OPS = {
+    '+': '+', '-': '-', '*': '*', '%': '%',
+    '==': '==', '!=': '!=', '<': '<', '>': '>', '<=': '<=', '>=': '>=',
+}
+
+# 需要辅助函数保持解释器语义的二元操作符
+_HELPER_OPS = {
+    '/': '_div',
+    '&&': '_and',
+    '||': '_or',
+}
+
+
+# ================== 常量折叠 ==================
+
+_LITERAL_TYPES = {bool: 'bool', int: 'int', float: 'float', str: 'string'}
+
+
+def _make_literal(value: Any) -> Optional[Literal]:
+    """把折叠结果包装为字面量；无法表示为源码字面量的值返回 None"""
+    type_name = _LITERAL_TYPES.get(type(value))
+    if type_name is None:
+        return None
+    if type_name == 'float' and not math.isfinite(value):
+        return None
+    return Literal(value, type_name)
+
+
+def _try_fold(fn: Callable, *args: Any) -> Optional[Literal]:
+    """在编译期计算常量；出错或结果无法表示为字面量时返回 None"""
+    try:
+        return _make_literal(fn(*args))
+    except Exception:
+        return None
+
+
+# 可在编译期对字面量参数求值的纯内置函数（与解释器中的实现一致）
+_PURE_BUILTINS: Dict[str, Callable] = {
+    'abs': lambda x: abs(x),
+    'sqrt': lambda x: x ** 0.5,
+}
+
+
+def _fold_binary_op(expr: BinaryOp, shadowed) -> Expression:
+    left = fold_constants(expr.left, shadowed)
+    right = fold_constants(expr.right, shadowed)
+    if isinstance(left, Literal) and isinstance(right, Literal) and expr.operator in BINARY_OPS:
+        folded = _try_fold(BINARY_OPS[expr.operator], left.value, right.value)
+        if folded is not None:
+            return folded
+    if left is expr.left and right is expr.right:
+        return expr
+    return BinaryOp(expr.operator, left, right)
+
+
+def _fold_unary_op(expr: UnaryOp, shadowed) -> Expression:
+    operand = fold_constants(expr.operand, shadowed)
+    if isinstance(operand, Literal) and expr.operator in UNARY_OPS:
+        folded = _try_fold(UNARY_OPS[expr.operator], operand.value)
+        if folded is not None:
+            return folded
+    if operand is expr.operand:
+        return expr
+    return UnaryOp(expr.operator, operand)
+
+
+def _fold_if(expr: IfExpression, shadowed) -> Expression:
+    condition = fold_constants(expr.condition, shadowed)
+    if isinstance(condition, Literal):
+        return fold_constants(expr.then_branch if condition.value else expr.else_branch, shadowed)
+    then_branch = fold_constants(expr.then_branch, shadowed)
+    else_branch = fold_constants(expr.else_branch, shadowed)
+    if (condition is expr.condition and then_branch is expr.then_branch
+            and else_branch is expr.else_branch):
+        return expr
+    return IfExpression(condition, then_branch, else_branch)
+
+
+def _fold_function_call(expr: FunctionCall, shadowed) -> Expression:
+    arguments = [fold_constants(arg, shadowed) for arg in expr.arguments]
+    if (expr.name in _PURE_BUILTINS and expr.name not in shadowed
+            and len(arguments) == 1 and isinstance(arguments[0], Literal)):
+        folded = _try_fold(_PURE_BUILTINS[expr.name], arguments[0].value)
+        if folded is not None:
+            return folded
+    if all(new is old for new, old in zip(arguments, expr.arguments)):
+        return expr
+    return FunctionCall(expr.name, arguments)
+
+
+def _fold_lambda(expr: Lambda, shadowed) -> Expression:
+    body = fold_constants(expr.body, shadowed)
+    return expr if body is expr.body else Lambda(expr.parameters, body)
+
+
+def _fold_children(cls, *fields):
+    """为只需递归折叠子表达式的节点生成折叠函数（字段按构造参数顺序给出）"""
+    def fold(expr, shadowed):
+        old = [getattr(expr, f) for f in fields]
+        new = [fold_constants(child, shadowed) for child in old]
+        if all(n is o for n, o in zip(new, old)):
+            return expr
+        return cls(*new)
+    return fold
+
+
+def _fold_array_literal(expr: ArrayLiteral, shadowed) -> Expression:
+    elements = [fold_constants(elem, shadowed) for elem in expr.elements]
+    if all(new is old for new, old in zip(elements, expr.elements)):
+        return expr
+    return ArrayLiteral(elements)
+
+
+def _fold_struct_literal(expr: StructLiteral, shadowed) -> Expression:
+    fields = tuple((name, fold_constants(value, shadowed)) for name, value in expr.fields)
+    if all(new[1] is old[1] for new, old in zip(fields, expr.fields)):
+        return expr
+    return StructLiteral(fields)
+
+
+def _fold_let(expr: LetExpression, shadowed) -> Expression:
+    value = fold_constants(expr.value, shadowed)
+    body = fold_constants(expr.body, shadowed)
+    if value is expr.value and body is expr.body:
+        return expr
+    return LetExpression(expr.name, value, body)
+
+
+def _fold_field_access(expr: FieldAccess, shadowed) -> Expression:
+    obj = fold_constants(expr.object, shadowed)
+    return expr if obj is expr.object else FieldAccess(obj, expr.field_name)
+
+
+# 按节点具体类型分派；PreOp / FoldOp 等时序节点保持原样
+_FOLDERS = {
+    BinaryOp: _fold_binary_op,
+    UnaryOp: _fold_unary_op,
+    IfExpression: _fold_if,
+    FunctionCall: _fold_function_call,
+    Lambda: _fold_lambda,
+    LetExpression: _fold_let,
+    ArrayLiteral: _fold_array_literal,
+    ArrayAccess: _fold_children(ArrayAccess, 'array', 'index'),
+    StructLiteral: _fold_struct_literal,
+    FieldAccess: _fold_field_access,
+    MapOp: _fold_children(MapOp, 'array', 'mapper'),
+    FilterOp: _fold_children(FilterOp, 'array', 'predicate'),
+    ReduceOp: _fold_children(ReduceOp, 'array', 'initial', 'accumulator'),
+}
+
+
+def fold_constants(expr: Expression, shadowed=()) -> Expression:
+    """
+    编译期常量折叠（自底向上，递归进入所有非时序子表达式）
+
+    - 两侧均为字面量的 BinaryOp / 操作数为字面量的 UnaryOp 替换为计算结果
+    - 参数为字面量的纯内置函数调用（abs、sqrt）替换为计算结果
+    - 条件为字面量的 IfExpression 替换为被选中的分支
+    求值出错的子表达式保持原样，以便运行时照常报告错误。
+    依赖在解析阶段已提取，折叠不会改变节点的依赖与 rank。
+
+    Args:
+        expr: 表达式 AST
+        shadowed: 用户定义的函数名（同名内置函数不折叠）
+    """
+    folder = _FOLDERS.get(type(expr))
+    if folder is None:
+        return expr
+    return folder(expr, shadowed)
+
+
+# ================== 代码生成 ==================
+
+class _Names(dict):
+    """依赖名 -> 局部变量名（渲染时按首次出现顺序填充），并携带生成代码可直接调用的函数表"""
+
+    def __init__(self, functions: Optional[Dict[str, Callable]] = None, *args: Any):
+        super().__init__(*args)
+        self.functions = functions if functions is not None else {}
+        self.next_dep = len(self)  # 下一个依赖局部变量的编号
+        self.bound = 0  # 已分配的绑定变量数
+        self.uses_env = False  # 是否有以绑定变量为根的字段路径（需经 env 查找完整路径）
+        # 公共子表达式提取的渲染状态（见 _render_body）
+        self.guarded = 0  # 大于 0 表示正在渲染条件分支
+        self.subexprs: Optional[Dict[str, list]] = None  # 第一遍：源码 -> [出现次数, 是否有条件分支外的出现]
+        self.keys: Dict[int, str] = {}  # 第一遍：id(子表达式) -> 源码
+        self.hoisted: Dict[str, Optional[str]] = {}  # 第二遍：需提取的源码 -> 临时变量名（未定义时为 None）
+        self.temps: List[Tuple[str, str]] = []  # 第二遍：(临时变量名, 源码)，按定义顺序
+
+
+def _render_literal(expr: Literal, names: Dict[str, str]) -> str:
+    return repr(expr.value)
+
+
+def _render_identifier(expr: Identifier, names: Dict[str, str]) -> str:
+    # 依赖值在函数入口处读入局部变量（v0, v1, ...），同一依赖只读取一次
+    return _dep_local(expr.name, names)
+
+
+def _dep_local(dep: str, names: Dict[str, str]) -> str:
+    """依赖对应的局部变量名（首次出现时分配）"""
+    local = names.get(dep)
+    if local is None:
+        number = getattr(names, 'next_dep', len(names))
+        if isinstance(names, _Names):
+            names.next_dep += 1
+        local = names[dep] = f"v{number}"
+    return local
+
+
+def _render_bound(body: Expression, params: List[str], names: Dict[str, str]) -> Tuple[List[str], str]:
+    """
+    在绑定了 params 的作用域中渲染 body，返回 (绑定变量名列表, 源码)
+
+    作用域内引用绑定变量的子表达式不能提前到函数入口计算，按条件分支处理
+    """
+    if not isinstance(names, _Names) or len(set(params)) != len(params):
+        raise UnsupportedExpression("binding")
+    shadowed = {param: names.pop(param) for param in params if param in names}
+    locals_ = []
+    for param in params:
+        local = names[param] = f"{_PARAM_PREFIX}{names.bound}"
+        names.bound += 1
+        locals_.append(local)
+    names.guarded += 1
+    try:
+        text = render(body, names)
+    finally:
+        names.guarded -= 1
+        for param in params:
+            del names[param]
+        names.update(shadowed)
+    return locals_, text
+
+
+def _render_binary_op(expr: BinaryOp, names: Dict[str, str]) -> str:
+    left = render(expr.left, names)
+    right = render(expr.right, names)
+    if expr.operator in _INFIX_OPS:
+        return f"({left} {_INFIX_OPS[expr.operator]} {right})"
+    if expr.operator in _HELPER_OPS:
+        return f"{_HELPER_OPS[expr.operator]}({left}, {right})"
+    raise UnsupportedExpression(f"binary operator {expr.operator}")
+
+
+def _render_unary_op(expr: UnaryOp, names: Dict[str, str]) -> str:
+    operand = render(expr.operand, names)
+    if expr.operator == '!':
+        return f"(not {operand})"
+    if expr.operator == '-':
+        return f"(-{operand})"
+    raise UnsupportedExpression(f"unary operator {expr.operator}")
+
+
+def _render_if(expr: IfExpression, names: Dict[str, str]) -> str:
+    condition = render(expr.condition, names)
+    # 分支只在条件成立时求值，其中的子表达式不单独提前计算
+    guarded = isinstance(names, _Names)
+    if guarded:
+        names.guarded += 1
+    then_branch = render(expr.then_branch, names)
+    else_branch = render(expr.else_branch, names)
+    if guarded:
+        names.guarded -= 1
+    return f"({then_branch} if {condition} else {else_branch})"
+
+
+def _render_function_call(expr: FunctionCall, names: Dict[str, str]) -> str:
+    # 只调用显式提供的函数（不含被用户函数覆盖的内置函数），其余交由解释器
+    functions = getattr(names, 'functions', {})
+    if expr.name not in functions:
+        raise UnsupportedExpression(f"function {expr.name}")
+    args = ', '.join(render(arg, names) for arg in expr.arguments)
+    return f"_fns[{expr.name!r}]({args})"
+
+
+def _render_array_literal(expr: ArrayLiteral, names: Dict[str, str]) -> str:
+    return f"[{', '.join(render(elem, names) for elem in expr.elements)}]"
+
+
+def _render_array_access(expr: ArrayAccess, names: Dict[str, str]) -> str:
+    return f"_index({render(expr.array, names)}, {render(expr.index, names)})"
+
+
+def _render_struct_literal(expr: StructLiteral, names: Dict[str, str]) -> str:
+    fields = ', '.join(f"{name!r}: {render(value, names)}" for name, value in expr.fields)
+    return f"{{{fields}}}"
+
+
+def _render_field_access(expr: FieldAccess, names: Dict[str, str]) -> str:
+    path = _get_field_path(expr)
+    if path is None:
+        # 对象不是标识符链（如 arr[0].x），直接访问字段
+        return f"_field({render(expr.object, names)}, {expr.field_name!r})"
+
+    root = path.split('.', 1)[0]
+    local = names.get(root)
+    if local is not None and local.startswith(_PARAM_PREFIX):
+        # 以绑定变量为根的路径：根值取自绑定变量
+        if isinstance(names, _Names):
+            names.uses_env = True
+        return f"_path(env, {path!r}, {local})"
+
+    # 以依赖为根的路径：与普通依赖一样在函数入口读入局部变量
+    return _dep_local(path, names)
+
+
+def _lambda_of(lam: Expression, arity: int) -> Lambda:
+    if not isinstance(lam, Lambda) or len(lam.parameters) != arity:
+        raise UnsupportedExpression("lambda")
+    return lam
+
+
+def _render_let(expr: LetExpression, names: Dict[str, str]) -> str:
+    value = render(expr.value, names)
+    (local,), body = _render_bound(expr.body, [expr.name], names)
+    return f"(lambda {local}: {body})({value})"
+
+
+def _render_map(expr: MapOp, names: Dict[str, str]) -> str:
+    mapper = _lambda_of(expr.mapper, 1)
+    array = render(expr.array, names)
+    (local,), body = _render_bound(mapper.body, mapper.parameters, names)
+    return f"[{body} for {local} in _array({array}, 'map')]"
+
+
+def _render_filter(expr: FilterOp, names: Dict[str, str]) -> str:
+    predicate = _lambda_of(expr.predicate, 1)
+    array = render(expr.array, names)
+    (local,), body = _render_bound(predicate.body, predicate.parameters, names)
+    return f"[{local} for {local} in _array({array}, 'filter') if {body}]"
+
+
+def _render_reduce(expr: ReduceOp, names: Dict[str, str]) -> str:
+    accumulator = _lambda_of(expr.accumulator, 2)
+    # 与解释器相同：先求值数组，再求值初始值
+    array = render(expr.array, names)
+    initial = render(expr.initial, names)
+    (acc, elem), body = _render_bound(accumulator.body, accumulator.parameters, names)
+    return f"_reduce(lambda {acc}, {elem}: {body}, _array({array}, 'reduce'), {initial})"
+
+
+_RENDERERS = {
+    Literal: _render_literal,
+    Identifier: _render_identifier,
+    BinaryOp: _render_binary_op,
+    UnaryOp: _render_unary_op,
+    IfExpression: _render_if,
+    FunctionCall: _render_function_call,
+    ArrayLiteral: _render_array_literal,
+    ArrayAccess: _render_array_access,
+    StructLiteral: _render_struct_literal,
+    FieldAccess: _render_field_access,
+    LetExpression: _render_let,
+    MapOp: _render_map,
+    FilterOp: _render_filter,
+    ReduceOp: _render_reduce,
+}
+
+
+def render(expr: Expression, names: Dict[str, str]) -> str:
+    """
+    将表达式渲染为 Python 表达式源码
+
+    Args:
+        expr: 表达式 AST
+        names: 依赖名 -> 局部变量名，渲染过程中按首次出现顺序填充；
+            为 _Names 时其 functions 为函数调用可直接使用的函数表
+    """
+    renderer = _RENDERERS.get(type(expr))
+    if renderer is None:
+        raise UnsupportedExpression(type(expr).__name__)
+    if not isinstance(names, _Names):
+        return renderer(expr, names)
+
+    # 第二遍：重复出现的子表达式只计算一次，之后引用临时变量
+    if names.hoisted:
+        key = names.keys.get(id(expr))
+        if key in names.hoisted:
+            temp = names.hoisted[key]
+            if temp is None:
+                # 先渲染（其中嵌套的重复子表达式先定义临时变量），再分配名称，
+                # 保证临时变量名唯一且按依赖顺序定义
+                text = renderer(expr, names)
+                temp = names.hoisted[key] = f"t{len(names.temps)}"
+                names.temps.append((temp, text))
+            return temp
+        return renderer(expr, names)
+
+    text = renderer(expr, names)
+    # 第一遍：统计非叶子子表达式的出现次数
+    if names.subexprs is not None and type(expr) is not Literal and not text.isidentifier():
+        names.keys[id(expr)] = text
+        entry = names.subexprs.get(text)
+        if entry is None:
+            names.subexprs[text] = [1, not names.guarded]
+        else:
+            entry[0] += 1
+            entry[1] = entry[1] or not names.guarded
+    return text
+
+
+def _render_body(expr: Expression, names: _Names) -> Tuple[List[Tuple[str, str]], str]:
+    """
+    渲染表达式，并把重复出现的子表达式提取为临时变量（公共子表达式消除）
+
+    先渲染一遍统计出现次数，再渲染一遍替换为临时变量。只提取至少有一次出现在
+    条件分支之外的子表达式：它们无论如何都会被求值，提前计算只改变求值时机；
+    求值出错时由调用方回退到解释器。
+
+    只在单个公式内消除，不在流之间共享：跨流共享需要为公共子表达式插入合成的流节点，
+    每个节点每次传播都有入队与调用开销（常见的共享子表达式如 a * 2 本身比这更便宜），
+    而且合成节点会出现在依赖图、print_graph、rank 与错误信息中。
+
+    Returns:
+        ([(临时变量名, 源码), ...], 返回值源码)；names 按最终渲染结果填充
+    """
+    probe = _Names(names.functions, names)
+    probe.bound = names.bound
+    probe.subexprs = {}
+    body = render(expr, probe)
+    hoisted = {text: None for text, (count, unguarded) in probe.subexprs.items()
+               if count >= 2 and unguarded}
+    if not hoisted:
+        names.update(probe)
+        names.uses_env = probe.uses_env
+        return [], body
+
+    names.keys = probe.keys
+    names.hoisted = hoisted
+    body = render(expr, names)
+    return names.temps, body
+
+
+def _build_function(func_name: str, params: List[str], names: Dict[str, str],
+                    temps: List[Tuple[str, str]], body: str, filename: str) -> Callable:
+    """
+    生成 def func_name(env, *params) 并返回函数对象；params 以外的依赖从 env 读入局部变量
+    （字段路径依赖经 _path 读取）
+    """
+    param_locals = [names[p] for p in params]
+    lines = [f"def {func_name}({', '.join(['env'] + param_locals)}):"]
+    lines.extend(
+        f"    {local} = _path(env, {dep!r})" if '.' in dep else f"    {local} = env[{dep!r}]"
+        for dep, local in names.items() if dep not in params
+    )
+    lines.extend(f"    {temp} = {text}" for temp, text in temps)
+    lines.append(f"    return {body}")
+    source = "\n".join(lines) + "\n"
+    namespace: Dict[str, Any] = {}
+    run_globals = dict(_RUNTIME_GLOBALS, _fns=getattr(names, 'functions', {}))
+    exec(compile(source, filename, "exec"), run_globals, namespace)
+    return namespace[func_name]
+
+
+def compile_expression(expr: Expression, name: str = "expr",
+                       functions: Optional[Dict[str, Callable]] = None) -> Optional[Callable[[Dict[str, Any]], Any]]:
+    """
+    将表达式编译为 Python 函数
+
+    Args:
+        expr: 表达式 AST
+        name: 所属节点名称（用于生成的函数名）
+        functions: 可在生成代码中直接调用的函数（函数名 -> 实现）；
+            调用表外函数的表达式不编译
+
+    Returns:
+        形如 f(env) 的函数；表达式包含不支持的节点时返回 None
+    """
+    names = _Names(functions)
+    try:
+        temps, body = _render_body(expr, names)
+    except UnsupportedExpression:
+        return None
+
+    func_name = f"_eval_{name}" if name.isidentifier() else "_eval"
+    return _build_function(func_name, [], names, temps, body, f"<ripple:{name}>")
+
+
+def compile_positional(expr: Expression, name: str, fallback: Callable[[Dict[str, Any]], Any],
+                       functions: Optional[Dict[str, Callable]] = None
+                       ) -> Optional[Tuple[Callable[..., Any], Tuple[str, ...]]]:
+    """
+    将表达式编译为按位置接收依赖值的 Python 函数
+
+    生成的函数出错时以 {依赖名: 值} 调用 fallback（通常为解释器），
+    以给出与解释器一致的结果或错误信息。
+
+    Args:
+        expr: 表达式 AST
+        name: 所属节点名称（用于生成的函数名）
+        fallback: 出错时的回退求值函数
+        functions: 同 compile_expression
+
+    Returns:
+        (函数, 依赖名顺序)；表达式包含不支持的节点或字段路径依赖时返回 None
+    """
+    names = _Names(functions)
+    try:
+        temps, body = _render_body(expr, names)
+    except UnsupportedExpression:
+        return None
+    # 字段路径需要从参数字典按路径查找，不能按位置传入
+    if names.uses_env or any('.' in dep for dep in names):
+        return None
+
+    params = ', '.join(names.values())
+    env = ', '.join(f"{dep!r}: {local}" for dep, local in names.items())
+    func_name = f"_eval_{name}" if name.isidentifier() else "_eval"
+    source = (
+        f"def {func_name}({params}):\n"
+        f"    try:\n"
+        + "".join(f"        {temp} = {text}\n" for temp, text in temps)
+        + f"        return {body}\n"
+        f"    except Exception:\n"
+        f"        return _fallback({{{env}}})\n"
+    )
+    namespace: Dict[str, Any] = {}
+    run_globals = dict(_RUNTIME_GLOBALS, _fns=names.functions, _fallback=fallback, Exception=Exception)
+    exec(compile(source, f"<ripple:{name}>", "exec"), run_globals, namespace)
+    return namespace[func_name], tuple(names)
+
+
+def compile_lambda(lam: Lambda, functions: Optional[Dict[str, Callable]] = None) -> Optional[Callable[..., Any]]:
+    """
+    将 Lambda 编译为 Python 函数（functions 含义同 compile_expression）
+
+    Returns:
+        形如 f(env, *args) 的函数，参数按位置传入，自由变量从 env 读取；
+        函数体包含不支持的节点时返回 None
+    """
+    if len(set(lam.parameters)) != len(lam.parameters):
+        return None
+
+    names = _Names(functions, {param: f"{_PARAM_PREFIX}{i}" for i, param in enumerate(lam.parameters)})
+    names.bound = len(lam.parameters)
+    try:
+        temps, body = _render_body(lam.body, names)
+    except UnsupportedExpression:
+        return None
+
+    return _build_function("_lambda", list(lam.parameters), names, temps, body, "<ripple:lambda>")
+
+
+def compile_function(name: str, params: List[str], body: Expression,
+                     functions: Dict[str, Callable]) -> Optional[Callable[..., Any]]:
+    """
+    将不含自由变量的用户函数编译为 Python 函数
+
+    解释器中函数体能看到调用方的上下文，含自由变量的函数结果取决于调用位置，
+    因此只编译函数体只引用参数的函数。函数体中的函数调用在运行时从 functions 查找，
+    之后加入 functions 的函数（包括自身，用于递归）同样可以调用。
+
+    Returns:
+        形如 f(*args) 的函数；函数体包含不支持的节点或自由变量时返回 None
+    """
+    if len(set(params)) != len(params):
+        return None
+
+    names = _Names(functions, {param: f"{_PARAM_PREFIX}{i}" for i, param in enumerate(params)})
+    names.bound = len(params)
+    try:
+        temps, body = _render_body(body, names)
+    except UnsupportedExpression:
+        return None
+    if names.uses_env or len(names) != len(params):
+        return None
+
+    func_name = f"_fn_{name}" if name.isidentifier() else "_fn"
+    source = (
+        f"def {func_name}({', '.join(names.values())}):\n"
+        + "".join(f"    {temp} = {text}\n" for temp, text in temps)
+        + f"    return {body}\n"
+    )
+    namespace: Dict[str, Any] = {}
+    run_globals = dict(_RUNTIME_GLOBALS, _fns=functions)
+    exec(compile(source, f"<ripple:fn {name}>", "exec"), run_globals, namespace)
+    return namespace[func_name]
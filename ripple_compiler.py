@@ -3,11 +3,14 @@ Ripple Language - Enhanced Compiler (增强版编译器)
 集成完整的错误处理机制
 """
 
-from typing import Dict, Any, Callable, Set, List, Optional
+import sys
+import os
+from collections import deque
+from typing import Dict, Any, Callable, FrozenSet, Set, List, Optional, Tuple
 from ripple_ast import *
 from ripple_parser import RippleParser
 from ripple_lexer import RippleLexer
-from ripple_engine import RippleEngine, ExpressionEvaluator
+from ripple_engine import RippleEngine, ExpressionEvaluator, _load_csv_file, _get_csv_header
 from ripple_errors import (
     CircularDependencyError,
     UndefinedReferenceError,
@@ -19,14 +22,25 @@ from ripple_errors import (
     CompileError
 )
 from ripple_typechecker import TypeChecker
+from ripple_codegen import compile_expression, compile_positional, fold_constants
 
 
 class RippleCompiler:
     """Ripple 编译器（带完整错误检查）"""
 
+    __slots__ = (
+        'engine', 'evaluator', 'source_code', 'error_reporter', 'user_functions',
+        'type_defs', 'type_checker', 'csv_sources', 'verbose',
+        '_struct_type_cache', '_type_str_cache', '_field_paths_cache', '_codegen_functions',
+        '_norm_cache', '_csv_cache',
+    )
+
     def __init__(self, verbose: bool = False):
         self.engine = RippleEngine()
         self.evaluator = ExpressionEvaluator(self.engine)
+        # 公式中的 load_csv / csv_header 调用共用本编译器的 CSV 缓存
+        self.evaluator.builtin_functions.update(load_csv=self._load_csv_cached,
+                                                csv_header=self._csv_header_cached)
         self.source_code = ""
         self.error_reporter = None
         self.user_functions: Dict[str, FuncDecl] = {}
@@ -34,6 +48,15 @@ class RippleCompiler:
         self.type_checker = TypeChecker()
         self.csv_sources: Dict[str, Dict] = {}
         self.verbose = verbose
+        self._codegen_functions: Dict[str, Callable] = {}
+        # (绝对路径, mtime_ns, 文件大小, skip_header) -> 解析后的 CSV 行（元组，不可修改）；
+        # skip_header 为 None 的键保存表头
+        self._csv_cache: Dict[tuple, tuple] = {}
+        self._norm_cache: Dict[str, str] = {}  # 带点依赖 -> 规范化结果（源节点编译完成后有效）
+        # 类型节点 -> 解析结果（类型节点在一次编译内不可变；以节点对象为键，按身份哈希）
+        self._struct_type_cache: Dict[TypeNode, Optional[StructType]] = {}
+        self._type_str_cache: Dict[TypeNode, str] = {}
+        self._field_paths_cache: Dict[str, List[Tuple[str, str]]] = {}  # 结构体源名 -> (字段名, 字段节点名)
 
     def _log(self, msg: str):
         """仅在 verbose 模式下打印"""
@@ -43,18 +66,35 @@ class RippleCompiler:
     def compile(self, ast: Program):
         """编译程序（带错误检查）"""
         self.error_reporter = ErrorReporter(self.source_code)
+        self._struct_type_cache.clear()
+        self._type_str_cache.clear()
+        self._field_paths_cache.clear()
+
+        # 按声明类型单次分类（各阶段直接使用分类后的列表，保持声明顺序）
+        type_decls, func_decls, source_decls, stream_decls, sink_decls = [], [], [], [], []
+        decls_by_type = {
+            TypeDecl: type_decls,
+            FuncDecl: func_decls,
+            SourceDecl: source_decls,
+            StreamDecl: stream_decls,
+            SinkDecl: sink_decls,
+        }
+        for stmt in ast.statements:
+            decls = decls_by_type.get(type(stmt))
+            if decls is not None:
+                decls.append(stmt)
 
         # 0a. 编译类型定义
-        for stmt in ast.statements:
-            if isinstance(stmt, TypeDecl):
-                self._compile_type_decl(stmt)
+        for stmt in type_decls:
+            self._compile_type_decl(stmt)
 
         # 0b. 编译函数定义
-        for stmt in ast.statements:
-            if isinstance(stmt, FuncDecl):
-                self._compile_func(stmt)
+        for stmt in func_decls:
+            self._compile_func(stmt)
 
         self.evaluator.user_functions = self.user_functions
+        # 生成代码可直接调用的内置函数（用户函数定义完成后确定）
+        self._codegen_functions = self.evaluator.compile_functions()
 
         # 0c. 类型推断与检查
         self.type_checker.type_aliases = self.type_defs
@@ -70,22 +110,17 @@ class RippleCompiler:
             self.error_reporter.print_report()
             self.error_reporter.raise_if_errors()
 
-        # 2. 收集所有定义
+        # 2. 收集所有源名称（含结构体字段）
         source_names = set()
-        stream_decls = []
 
-        for stmt in ast.statements:
-            if isinstance(stmt, SourceDecl):
-                source_names.add(stmt.name)
-                type_sig = stmt.type_sig
-                if type_sig is None:
-                    type_sig = self.type_checker.get_type(stmt.name)
-                struct_type = self._get_struct_type(type_sig)
-                if struct_type:
-                    for field_name in struct_type.fields.keys():
-                        source_names.add(f"{stmt.name}.{field_name}")
-            elif isinstance(stmt, StreamDecl):
-                stream_decls.append(stmt)
+        for stmt in source_decls:
+            source_names.add(stmt.name)
+            type_sig = stmt.type_sig
+            if type_sig is None:
+                type_sig = self.type_checker.get_type(stmt.name)
+            struct_type = self._get_struct_type(type_sig)
+            if struct_type:
+                source_names.update(path for _, path in self._struct_field_paths(stmt.name, struct_type))
 
         # 3. 检查未定义引用
         undefined_errors = UndefinedReferenceChecker.check(stream_decls, source_names)
@@ -97,7 +132,8 @@ class RippleCompiler:
             self.error_reporter.raise_if_errors()
 
         # 4. 检查循环依赖
-        cycle_errors = self._detect_circular_dependencies(stream_decls)
+        deps_graph = self._build_deps_graph(stream_decls)
+        cycle_errors = self._detect_circular_dependencies(deps_graph)
         for error in cycle_errors:
             self.error_reporter.add_error(error)
 
@@ -106,38 +142,52 @@ class RippleCompiler:
             self.error_reporter.raise_if_errors()
 
         # 5. 编译源声明
-        for stmt in ast.statements:
-            if isinstance(stmt, SourceDecl):
-                self._compile_source(stmt)
+        for stmt in source_decls:
+            self._compile_source(stmt)
+        # 源节点集合已确定，此后依赖规范化结果不再变化
+        self._norm_cache.clear()
 
         # 6. 计算 rank 并编译流声明
-        self._compute_ranks(stream_decls)
-
-        for stmt in sorted(stream_decls, key=lambda s: s.rank):
-            self._compile_stream(stmt)
+        for bucket in self._compute_ranks(stream_decls, deps_graph):
+            for stmt in bucket:
+                self._compile_stream(stmt)
 
         # 7. 编译 Sink 声明
-        for stmt in ast.statements:
-            if isinstance(stmt, SinkDecl):
-                self._compile_sink(stmt)
+        for stmt in sink_decls:
+            self._compile_sink(stmt)
+
+        # 没有整体引用的结构体源（只按字段访问）不必在每次字段变化时重新组装
+        for stmt in source_decls:
+            if not self.engine.nodes[stmt.name].is_source:
+                self.engine.make_lazy(stmt.name)
 
         # 8. 初始化所有节点值
         self._initialize_values(ast.statements)
 
-    def _detect_circular_dependencies(self, stream_decls: List[StreamDecl]) -> List[CircularDependencyError]:
-        """检测循环依赖"""
-        errors = []
-        deps_graph: Dict[str, Set[str]] = {}
+    def _build_deps_graph(self, stream_decls: List[StreamDecl]) -> Dict[str, FrozenSet[str]]:
+        """
+        构建流之间的静态依赖图（表达式依赖去掉自引用、计入触发器），供循环检测与 rank 计算共用
+
+        依赖总是由表达式本身得出，不依赖解析器填写的元数据，手工构造的声明也能正确排序
+        """
+        deps_graph = {}
         for decl in stream_decls:
-            filtered_deps = {dep for dep in decl.static_dependencies if dep != decl.name}
+            deps = set(extract_dependencies(decl.expression))
+            deps.discard(decl.name)
             if decl.trigger:
-                filtered_deps.add(decl.trigger)
-            deps_graph[decl.name] = filtered_deps
+                deps.add(decl.trigger)
+            deps_graph[decl.name] = frozenset(deps)
+        return deps_graph
 
-        detector = CircularDependencyDetector()
-        cycles = detector.find_all_cycles(deps_graph)
+    def _detect_circular_dependencies(self, deps_graph: Dict[str, FrozenSet[str]]) -> List[CircularDependencyError]:
+        """检测循环依赖"""
+        errors = []
+        # 常见情况下没有循环：先快速判断，只有确有循环时才做强连通分量分解
+        if not CircularDependencyDetector.has_cycle(deps_graph):
+            return errors
 
-        for cycle in cycles:
+        # 每个强连通分量报告一条循环
+        for cycle in CircularDependencyDetector.find_cycles(deps_graph):
             errors.append(CircularDependencyError(cycle))
 
         return errors
@@ -170,52 +220,74 @@ class RippleCompiler:
             self.engine.add_source(decl.name, initial_value)
 
     def _type_to_string(self, type_node: TypeNode) -> str:
-        """将类型节点转换为可读字符串"""
+        """将类型节点转换为可读字符串（按节点缓存）"""
         if type_node is None:
             return "unknown"
+        cached = self._type_str_cache.get(type_node)
+        if cached is not None:
+            return cached
         if isinstance(type_node, BasicType):
-            return type_node.name
+            result = type_node.name
         elif isinstance(type_node, ArrayType):
-            return f"[{self._type_to_string(type_node.element_type)}]"
+            result = f"[{self._type_to_string(type_node.element_type)}]"
         elif isinstance(type_node, StructType):
             fields_str = ", ".join(f"{k}: {self._type_to_string(v)}" for k, v in type_node.fields.items())
-            return f"{{{fields_str}}}"
+            result = f"{{{fields_str}}}"
         elif isinstance(type_node, FunctionType):
             params_str = ", ".join(self._type_to_string(p) for p in type_node.param_types)
-            return f"({params_str}) -> {self._type_to_string(type_node.return_type)}"
+            result = f"({params_str}) -> {self._type_to_string(type_node.return_type)}"
         else:
-            return str(type_node)
+            result = str(type_node)
+        self._type_str_cache[type_node] = result
+        return result
 
     def _get_struct_type(self, type_sig: Optional[TypeNode]) -> Optional[StructType]:
-        """获取结构体类型"""
+        """获取结构体类型（按类型节点缓存）"""
         if type_sig is None:
             return None
+        if type_sig in self._struct_type_cache:
+            return self._struct_type_cache[type_sig]
+        struct_type = None
         if isinstance(type_sig, StructType):
-            return type_sig
+            struct_type = type_sig
         elif isinstance(type_sig, BasicType):
-            if type_sig.name in self.type_defs:
-                type_def = self.type_defs[type_sig.name]
-                if isinstance(type_def, StructType):
-                    return type_def
-        return None
+            type_def = self.type_defs.get(type_sig.name)
+            if isinstance(type_def, StructType):
+                struct_type = type_def
+        self._struct_type_cache[type_sig] = struct_type
+        return struct_type
+
+    def _struct_field_paths(self, name: str, struct_type: StructType) -> List[Tuple[str, str]]:
+        """
+        结构体源的 (字段名, 字段节点名) 列表
+
+        字段节点名预先拼接并驻留，收集源名称与编译源节点时共用，避免重复构造字符串
+        """
+        field_paths = self._field_paths_cache.get(name)
+        if field_paths is None:
+            field_paths = self._field_paths_cache[name] = [
+                (field_name, sys.intern(f"{name}.{field_name}")) for field_name in struct_type.fields
+            ]
+        return field_paths
 
     def _compile_struct_source(self, name: str, struct_type: StructType, initial_value: Any):
         """编译结构体源"""
-        field_names = list(struct_type.fields.keys())
+        field_paths = self._struct_field_paths(name, struct_type)
 
-        for field_name in field_names:
-            field_node_name = f"{name}.{field_name}"
+        for field_name, field_node_name in field_paths:
             field_initial = None
             if initial_value and isinstance(initial_value, dict):
                 field_initial = initial_value.get(field_name)
             self.engine.add_source(field_node_name, field_initial)
 
-        field_deps = {f"{name}.{f}" for f in field_names}
+        field_names = tuple(field_name for field_name, _ in field_paths)
+        field_node_names = tuple(field_node_name for _, field_node_name in field_paths)
 
-        def struct_formula(args):
-            return {field_name: args.get(f"{name}.{field_name}") for field_name in field_names}
+        # 字段值按位置传入（顺序与 field_names 一致），直接组装为结构体
+        def struct_formula(*values):
+            return dict(zip(field_names, values))
 
-        self.engine.add_stream(name, struct_formula, field_deps)
+        self.engine.add_stream(name, struct_formula, set(field_node_names), arg_names=field_node_names)
 
     def _compile_type_decl(self, decl: TypeDecl):
         """编译类型定义"""
@@ -229,34 +301,90 @@ class RippleCompiler:
             raise CompileError(f"Duplicate function definition: '{decl.name}'")
         self.user_functions[decl.name] = decl
 
-    def _compile_stream(self, decl: StreamDecl):
-        """编译流声明"""
-        expr = decl.expression
+    def _compiled_formula(self, expr: Expression, compiled: Callable) -> Callable:
+        """包装代码生成得到的函数；出错时交由解释器重新求值以保持原有错误信息"""
+        def formula(args):
+            try:
+                return compiled(args)
+            except Exception:
+                return self.evaluator.evaluate(expr, args)
+
+        return formula
+
+    def _positional_formula(self, expr: Expression, name: str) -> Optional[Tuple[Callable, Tuple[str, ...]]]:
+        """
+        生成按位置接收依赖值的公式（不构建参数字典）
+
+        Returns:
+            (公式, 依赖名顺序)；表达式无法编译或依赖不全是已注册节点时返回 None
+        """
+        evaluate = self.evaluator.evaluate
+        positional = compile_positional(expr, name, lambda env: evaluate(expr, env), self._codegen_functions)
+        if positional is None:
+            return None
+        if not all(dep in self.engine.nodes for dep in positional[1]):
+            return None
+        return positional
+
+    def _interpreted_formula(self, name: str, expr: Expression) -> Callable:
+        """无状态流的解释执行公式（代码生成不支持该表达式时使用）"""
+        evaluate = self.evaluator.evaluate
 
         def formula(args):
-            eval_context = dict(args)
+            # args 由引擎每次重算时新建，直接作为求值上下文，不再复制
             # 传递当前节点名称（用于处理自引用 pre）
-            eval_context['__current_node__'] = decl.name
-
-            if decl.is_stateful:
-                prev_state = args.get('__state__')
-                if prev_state is None:
-                    prev_state = {}
-                # 传递状态信息给 evaluator
-                eval_context['__temporal_state__'] = prev_state
-                new_value = self.evaluator.evaluate(expr, eval_context)
-                # 获取更新后的状态
-                new_state = eval_context.get('__temporal_state__', prev_state)
-                # 处理自引用 pre：将计算结果存储为下次的"前一个值"
-                if new_state.get('__self_ref_pre__'):
-                    pre_key = f'__pre_{decl.name}__'
-                    new_state[pre_key] = new_value
-                    del new_state['__self_ref_pre__']
-                return (new_value, new_state)
+            args['__current_node__'] = name
+            return evaluate(expr, args)
+
+        return formula
+
+    def _stateful_formula(self, name: str, expr: Expression) -> Callable:
+        """有状态流（含 pre / fold）的公式，返回 (新值, 新状态)"""
+        evaluate = self.evaluator.evaluate
+        pre_key = f'__pre_{name}__'
+
+        def formula(args):
+            # args 由引擎每次重算时新建，直接作为求值上下文，不再复制
+            # 传递当前节点名称（用于处理自引用 pre）
+            args['__current_node__'] = name
+
+            prev_state = args.get('__state__')
+            if prev_state is None:
+                prev_state = {}
+            # 传递状态信息给 evaluator
+            args['__temporal_state__'] = prev_state
+            new_value = evaluate(expr, args)
+            # 获取更新后的状态
+            new_state = args.get('__temporal_state__', prev_state)
+            # 处理自引用 pre：将计算结果存储为下次的"前一个值"
+            if new_state.get('__self_ref_pre__'):
+                new_state[pre_key] = new_value
+                del new_state['__self_ref_pre__']
+            return (new_value, new_state)
+
+        return formula
+
+    def _compile_stream(self, decl: StreamDecl):
+        """编译流声明"""
+        expr = fold_constants(decl.expression, self.user_functions)
+
+        # 公式形态在编译期确定：有状态 / 生成代码（按位置或按字典传参）/ 解释执行
+        arg_names = None
+        is_stateful = is_stateful_expr(decl.expression)
+        if is_stateful:
+            formula = self._stateful_formula(decl.name, expr)
+        else:
+            positional = self._positional_formula(expr, decl.name)
+            if positional is not None:
+                formula, arg_names = positional
             else:
-                return self.evaluator.evaluate(expr, eval_context)
+                compiled = compile_expression(expr, decl.name, self._codegen_functions)
+                if compiled is not None:
+                    formula = self._compiled_formula(expr, compiled)
+                else:
+                    formula = self._interpreted_formula(decl.name, expr)
 
-        dependencies = self._normalize_dependencies(decl.static_dependencies)
+        dependencies = self._normalize_dependencies(extract_dependencies(decl.expression))
 
         if decl.trigger:
             normalized_trigger = self._normalize_dependency(decl.trigger)
@@ -268,15 +396,20 @@ class RippleCompiler:
         if decl.trigger:
             trigger_deps = {normalized_trigger}
 
-        self.engine.add_stream(decl.name, formula, dependencies, decl.is_stateful, None, trigger_deps)
+        self.engine.add_stream(decl.name, formula, dependencies, is_stateful, None, trigger_deps,
+                               arg_names=arg_names)
 
     def _normalize_dependency(self, dep: str) -> str:
-        """规范化单个依赖"""
+        """规范化单个依赖（带点的依赖结果按字符串缓存）"""
         if '.' not in dep:
             return dep
-        if dep in self.engine.nodes and self.engine.nodes[dep].is_source:
-            return dep
-        return dep.split('.')[0]
+        normalized = self._norm_cache.get(dep)
+        if normalized is None:
+            node = self.engine.nodes.get(dep)
+            # 截取出的根名称是新字符串，驻留后与节点名共享同一对象
+            normalized = dep if node is not None and node.is_source else sys.intern(dep.split('.', 1)[0])
+            self._norm_cache[dep] = normalized
+        return normalized
 
     def _normalize_dependencies(self, deps: List[str]) -> Set[str]:
         """规范化依赖列表"""
@@ -284,14 +417,54 @@ class RippleCompiler:
 
     def _compile_sink(self, decl: SinkDecl):
         """编译 Sink 声明"""
-        expr = decl.expression
-        raw_dependencies = extract_dependencies(expr)
-        dependencies = self._normalize_dependencies(raw_dependencies)
+        expr = fold_constants(decl.expression, self.user_functions)
+        dependencies = self._normalize_dependencies(extract_dependencies(decl.expression))
 
-        def formula(args):
-            return self.evaluator.evaluate(expr, args)
+        arg_names = None
+        positional = self._positional_formula(expr, decl.name)
+        if positional is not None:
+            formula, arg_names = positional
+        else:
+            compiled = compile_expression(expr, decl.name, self._codegen_functions)
+            if compiled is not None:
+                formula = self._compiled_formula(expr, compiled)
+            else:
+                def formula(args):
+                    return self.evaluator.evaluate(expr, args)
+
+        self.engine.add_sink(decl.name, formula, dependencies, arg_names=arg_names)
 
-        self.engine.add_sink(decl.name, formula, dependencies)
+    def _csv_key(self, path: str, skip_header: Optional[bool]) -> Optional[tuple]:
+        """CSV 缓存键；文件不存在等情况返回 None（交给加载函数报告原有的错误）"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, skip_header)
+
+    def _load_csv_cached(self, path: str, skip_header: bool = False) -> List[List[Any]]:
+        """
+        load_csv 内置函数：同一文件（路径、修改时间与大小相同）在本编译器内只解析一次
+
+        缓存中保存元组，每次返回新的列表副本，调用方原地修改不会影响其他读取
+        """
+        key = self._csv_key(path, skip_header)
+        if key is None:
+            return _load_csv_file(path, skip_header)
+        rows = self._csv_cache.get(key)
+        if rows is None:
+            rows = self._csv_cache[key] = tuple(tuple(row) for row in _load_csv_file(path, skip_header))
+        return [list(row) for row in rows]
+
+    def _csv_header_cached(self, path: str) -> List[str]:
+        """csv_header 内置函数：按路径、修改时间与大小缓存表头"""
+        key = self._csv_key(path, None)
+        if key is None:
+            return _get_csv_header(path)
+        header = self._csv_cache.get(key)
+        if header is None:
+            header = self._csv_cache[key] = tuple(_get_csv_header(path))
+        return list(header)
 
     def _extract_csv_info(self, expr) -> Optional[Dict]:
         """从表达式中提取 CSV 信息"""
@@ -318,57 +491,73 @@ class RippleCompiler:
 
         return {'path': path, 'skip_header': skip_header}
 
-    def _compute_ranks(self, stream_decls: List[StreamDecl]):
-        """计算流声明的拓扑高度"""
-        deps_graph: Dict[str, set] = {}
-        for decl in stream_decls:
-            filtered_deps = {dep for dep in decl.static_dependencies if dep != decl.name}
-            if decl.trigger:
-                filtered_deps.add(decl.trigger)
-            deps_graph[decl.name] = filtered_deps
-
+    def _compute_ranks(self, stream_decls: List[StreamDecl],
+                       deps_graph: Dict[str, FrozenSet[str]]) -> List[List[StreamDecl]]:
+        """
+        计算流声明的拓扑高度
+
+        Args:
+            stream_decls: 流声明
+            deps_graph: _build_deps_graph 构建的依赖图
+
+        Returns:
+            按 rank 分桶的流声明，桶内保持声明顺序
+        """
+        # Kahn 拓扑排序（迭代，最长路径）：只统计流之间的依赖边
+        dependents: Dict[str, List[str]] = {name: [] for name in deps_graph}
+        in_degree: Dict[str, int] = {}
+        for name, deps in deps_graph.items():
+            stream_deps = [dep for dep in deps if dep in deps_graph]
+            in_degree[name] = len(stream_deps)
+            for dep in stream_deps:
+                dependents[dep].append(name)
+
+        # 无依赖的流 rank 为 0；只依赖源的流 rank 为 1
         ranks: Dict[str, int] = {}
-        visited: set = set()
-
-        def compute_rank(name: str) -> int:
-            if name in ranks:
-                return ranks[name]
-            if name in visited:
-                raise CircularDependencyError([name])
-            visited.add(name)
-
-            if name not in deps_graph or not deps_graph[name]:
-                ranks[name] = 0
-                visited.remove(name)
-                return 0
-
-            max_dep_rank = 0
-            for dep in deps_graph[name]:
-                if dep in deps_graph:
-                    dep_rank = compute_rank(dep)
-                    max_dep_rank = max(max_dep_rank, dep_rank)
-
-            rank = max_dep_rank + 1
-            ranks[name] = rank
-            visited.remove(name)
-            return rank
-
+        queue = deque()
+        for name, degree in in_degree.items():
+            if degree == 0:
+                ranks[name] = 1 if deps_graph[name] else 0
+                queue.append(name)
+
+        while queue:
+            name = queue.popleft()
+            next_rank = ranks[name] + 1
+            for dependent in dependents[name]:
+                if ranks.get(dependent, 0) < next_rank:
+                    ranks[dependent] = next_rank
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    queue.append(dependent)
+
+        remaining = [name for name, degree in in_degree.items() if degree > 0]
+        if remaining:
+            raise CircularDependencyError(remaining)
+
+        buckets: List[List[StreamDecl]] = []
         for decl in stream_decls:
-            decl.rank = compute_rank(decl.name)
+            rank = decl.rank = ranks[decl.name]
+            while len(buckets) <= rank:
+                buckets.append([])
+            buckets[rank].append(decl)
+        return buckets
 
     def _initialize_values(self, statements: List):
-        """初始化所有节点的值"""
-        stream_nodes = [(name, node) for name, node in self.engine.nodes.items() if not node.is_source]
-        stream_nodes.sort(key=lambda x: x[1].rank)
-
-        for name, node in stream_nodes:
-            if node.formula:
-                # 有触发器的流不在初始化时执行公式，使用初始值
-                if node.has_trigger:
-                    node.cached_value = node.initial_value
-                else:
-                    new_value = self.engine._recompute(node)
-                    node.cached_value = new_value
+        """
+        初始化所有节点的值
+
+        节点的依赖总是先于它注册（流按 rank 分桶编译，Sink 最后编译），
+        因此按注册顺序单次遍历 node_list 即为拓扑序，无需再按 rank 排序
+        """
+        recompute = self.engine._recompute
+        for node in self.engine.node_list:
+            if node.is_source or not node.formula:
+                continue
+            # 有触发器的流不在初始化时执行公式，使用初始值
+            if node.has_trigger:
+                node.cached_value = node.initial_value
+            else:
+                node.cached_value = recompute(node)
 
     def run(self, source_code: str) -> RippleEngine:
         """编译并返回引擎"""
@@ -3,13 +3,15 @@ Ripple Language - Graph Engine (图归约引擎)
 实现基于依赖图的响应式运行时
 """
 
-from typing import Dict, List, Any, Optional, Set, Callable
+from typing import Dict, List, Any, Optional, Set, Callable, Tuple
 from dataclasses import dataclass, field
 from collections import defaultdict
-import heapq
+from functools import reduce
+import operator
 import csv
 import os
 from ripple_ast import *
+from ripple_codegen import BINARY_OPS, UNARY_OPS, compile_function, compile_lambda
 
 
 def _infer_csv_value(s: str) -> Any:
@@ -86,43 +88,78 @@ def _get_csv_row(data: List[List[Any]], row_idx: int) -> List[Any]:
     return []
 
 
-@dataclass
+# 内置函数表（解释器与生成代码共用）
+BUILTIN_FUNCTIONS: Dict[str, Callable] = {
+    # 数学函数
+    'abs': abs,
+    'max': lambda *args: max(args) if len(args) > 1 else max(args[0]) if isinstance(args[0], list) else args[0],
+    'min': lambda *args: min(args) if len(args) > 1 else min(args[0]) if isinstance(args[0], list) else args[0],
+    'sqrt': lambda x: x ** 0.5,
+
+    # 数组函数
+    'len': lambda arr: len(arr) if isinstance(arr, list) else len(str(arr)),
+    'head': lambda arr: arr[0] if arr else None,
+    'tail': lambda arr: arr[1:] if isinstance(arr, list) else [],
+    'last': lambda arr: arr[-1] if arr else None,
+    'sum': lambda arr: sum(arr) if isinstance(arr, list) else arr,
+    'reverse': lambda arr: list(reversed(arr)) if isinstance(arr, list) else arr,
+
+    # 矩阵函数
+    'transpose': lambda m: [[row[i] for row in m] for i in range(len(m[0]))] if m and m[0] else [],
+
+    # CSV 文件函数
+    'load_csv': lambda path, *args: _load_csv_file(path, args[0] if args else False),
+    'csv_header': _get_csv_header,
+    'col': _get_csv_column,
+    'row': _get_csv_row,
+
+    # 统计函数
+    'avg': lambda arr: sum(arr) / len(arr) if arr else 0,
+    'count': len,
+    'count_if': lambda arr, pred: sum(1 for x in arr if pred(x)),
+}
+
+# 可按值比较判断“未变化”的不可变标量类型
+_SCALAR_TYPES = (int, float, str, bool, type(None))
+
+
+@dataclass(slots=True)
 class GraphNode:
     """图中的节点"""
     name: str
+    id: int = 0  # 整数编号（RippleEngine.node_list 中的下标）
     formula: Optional[Callable] = None  # 计算公式
     cached_value: Any = None  # 缓存的值
     rank: int = 0  # 拓扑高度
     is_stateful: bool = False  # 是否有状态
     state: Any = None  # 状态存储（用于 pre 和 fold）
     dependencies: Set[str] = field(default_factory=set)  # 依赖的节点
-    subscribers: Set[str] = field(default_factory=set)  # 订阅者（子节点）
+    dep_nodes: Tuple[Tuple[str, 'GraphNode'], ...] = field(default=(), repr=False)  # 已注册依赖的 (名称, 节点)
+    arg_nodes: Optional[Tuple['GraphNode', ...]] = field(default=None, repr=False)  # 非 None 时公式按位置接收这些节点的值：formula(*values)
+    subscribers: List['GraphNode'] = field(default_factory=list, repr=False, compare=False)  # 订阅者（按注册顺序，不重复）
     is_dirty: bool = False  # 是否需要重新计算
+    is_queued: bool = False  # 是否已在待计算队列中
+    is_lazy: bool = False  # 是否按需计算（不随依赖变化重算，读取值时再求值）
     is_source: bool = False  # 是否是源节点
     has_trigger: bool = False  # 是否有触发器（on trigger）
     initial_value: Any = None  # 初始值（用于 on trigger 的流）
 
 
-@dataclass
-class PriorityQueueItem:
-    """优先队列项"""
-    rank: int
-    name: str
-
-    def __lt__(self, other):
-        return self.rank < other.rank
-
-
 class RippleEngine:
     """Ripple 图归约引擎"""
 
     def __init__(self):
+        # 名称只在 API 边界使用；内部按整数编号索引 node_list
         self.nodes: Dict[str, GraphNode] = {}
-        self.priority_queue: List[PriorityQueueItem] = []
-        self.in_queue: Set[str] = set()
+        self.node_list: List[GraphNode] = []
+        # 按 rank 分桶的待计算队列：rank_buckets[r] 为 rank 为 r 的待计算节点
+        # 节点的 rank 在注册时确定且订阅者 rank 严格更大，因此按桶顺序扫描即为拓扑序
+        self.rank_buckets: List[List[GraphNode]] = [[]]
         self.time_step = 0
         self.sinks: List[str] = []  # Sink 节点列表
         self.context: Dict[str, Any] = {}  # Lambda 表达式的上下文
+        # 注册时尚不存在的依赖名 -> 等待它的节点（依赖注册后补充绑定）
+        self._pending_deps: Dict[str, List[GraphNode]] = {}
 
     def add_source(self, name: str, initial_value: Any = None):
         """添加源节点"""
@@ -132,18 +169,40 @@ class RippleEngine:
             rank=0,
             is_source=True
         )
-        self.nodes[name] = node
+        self._register(node)
+
+    def _register(self, node: GraphNode):
+        """登记节点并分配整数编号"""
+        node.id = len(self.node_list)
+        self.node_list.append(node)
+        self.nodes[node.name] = node
+
+        # 先于本节点注册的依赖者：补充绑定，重算时即可读到本节点的值
+        # （与按名称查找时一致，只补充取值，不补充订阅：依赖者的 rank 已确定）
+        for waiting in self._pending_deps.pop(node.name, ()):
+            waiting.dep_nodes += ((node.name, node),)
 
     def add_stream(self, name: str, formula: Callable, dependencies: Set[str],
                    is_stateful: bool = False, initial_state: Any = None,
-                   trigger_deps: Set[str] = None, initial_value: Any = 0):
+                   trigger_deps: Set[str] = None, initial_value: Any = 0,
+                   arg_names: Optional[Tuple[str, ...]] = None):
         """添加流节点
 
         Args:
             trigger_deps: 触发依赖（只有这些依赖变化时才重新计算）
                           如果为 None，则所有 dependencies 都是触发依赖
             initial_value: 初始值（用于有触发器的流）
+            arg_names: 按位置传参的依赖顺序（均须为已注册节点）；
+                       为 None 时公式接收参数字典
+
+        Raises:
+            ValueError: arg_names 中有未注册的节点
         """
+        if arg_names is not None:
+            missing = [dep for dep in arg_names if dep not in self.nodes]
+            if missing:
+                raise ValueError(f"Positional dependencies of '{name}' are not registered: {missing}")
+
         # 计算 rank（基于依赖节点的最大 rank + 1）
         max_dep_rank = 0
         for dep in dependencies:
@@ -153,6 +212,12 @@ class RippleEngine:
         rank = max_dep_rank + 1
         has_trigger = trigger_deps is not None
 
+        # 按需计算的节点有了依赖者后需恢复为随依赖更新
+        for dep in dependencies:
+            dep_node = self.nodes.get(dep)
+            if dep_node is not None and dep_node.is_lazy:
+                self._make_eager(dep_node)
+
         node = GraphNode(
             name=name,
             formula=formula,
@@ -160,10 +225,21 @@ class RippleEngine:
             is_stateful=is_stateful,
             state=initial_state,
             dependencies=dependencies,
+            dep_nodes=tuple((dep, self.nodes[dep]) for dep in dependencies if dep in self.nodes),
             has_trigger=has_trigger,
-            initial_value=initial_value
+            initial_value=initial_value,
+            arg_nodes=None if arg_names is None else tuple(self.nodes[dep] for dep in arg_names)
         )
-        self.nodes[name] = node
+        self._register(node)
+
+        # 尚未注册的依赖在注册时再绑定
+        for dep in dependencies:
+            if dep not in self.nodes:
+                self._pending_deps.setdefault(dep, []).append(node)
+
+        # 预分配 rank 桶
+        while len(self.rank_buckets) <= rank:
+            self.rank_buckets.append([])
 
         # 确定哪些依赖应该触发更新
         subscribe_deps = trigger_deps if trigger_deps is not None else dependencies
@@ -171,93 +247,143 @@ class RippleEngine:
         # 只注册到触发依赖的订阅者列表
         for dep in subscribe_deps:
             if dep in self.nodes:
-                self.nodes[dep].subscribers.add(name)
+                self.nodes[dep].subscribers.append(node)
 
-    def add_sink(self, name: str, formula: Callable, dependencies: Set[str]):
+    def make_lazy(self, name: str):
+        """
+        将没有依赖者的无状态流改为按需计算：依赖变化时不再重算，读取值时再求值
+        （有状态、有触发器的流与 Sink 保持不变）
+        """
+        node = self.nodes[name]
+        if (node.is_lazy or node.is_source or node.is_stateful or node.has_trigger
+                or node.subscribers or name in self.sinks):
+            return
+        # 迟于本节点注册的依赖没有订阅关系，这样的节点保持原样
+        if any(node not in dep_node.subscribers for _, dep_node in node.dep_nodes):
+            return
+        for _, dep_node in node.dep_nodes:
+            dep_node.subscribers.remove(node)
+        node.is_lazy = True
+
+    def _make_eager(self, node: GraphNode):
+        """恢复按需计算的节点：重新订阅依赖并刷新当前值"""
+        node.is_lazy = False
+        for _, dep_node in node.dep_nodes:
+            dep_node.subscribers.append(node)
+        node.cached_value = self._recompute(node)
+
+    def add_sink(self, name: str, formula: Callable, dependencies: Set[str],
+                 arg_names: Optional[Tuple[str, ...]] = None):
         """添加 Sink 节点（输出节点）"""
-        self.add_stream(name, formula, dependencies)
+        self.add_stream(name, formula, dependencies, arg_names=arg_names)
         self.sinks.append(name)
 
     def push_event(self, source_name: str, value: Any):
         """向源节点推送事件"""
+        for field_node_name, field_value in self._resolve_event(source_name, value):
+            self._update_source(field_node_name, field_value)
+        self.propagate()
+
+    def push_events(self, updates: Dict[str, Any]):
+        """
+        批量推送事件：先更新全部源节点，再统一传播一次
+        （受多个源共同影响的节点只重算一次）
+        """
+        # 先检查全部事件再更新，任何一个名称无效时不修改引擎状态
+        resolved = [self._resolve_event(source_name, value)
+                    for source_name, value in updates.items()]
+        for source_updates in resolved:
+            for field_node_name, field_value in source_updates:
+                self._update_source(field_node_name, field_value)
+        self.propagate()
+
+    def _resolve_event(self, source_name: str, value: Any) -> List[Tuple[str, Any]]:
+        """将事件解析为要更新的源节点及其值（不修改状态），名称无效时抛出 ValueError"""
         # 检查是否是结构体整体更新
         if source_name in self.nodes and not self.nodes[source_name].is_source:
             # 可能是结构体虚拟节点，尝试更新字段节点
             if isinstance(value, dict):
-                updated_any = False
+                source_updates = []
                 for field_name, field_value in value.items():
                     field_node_name = f"{source_name}.{field_name}"
                     if field_node_name in self.nodes and self.nodes[field_node_name].is_source:
-                        self._update_source(field_node_name, field_value)
-                        updated_any = True
-                if updated_any:
-                    self.propagate()
-                    return
+                        source_updates.append((field_node_name, field_value))
+                if source_updates:
+                    return source_updates
             raise ValueError(f"'{source_name}' is not a source node")
 
         if source_name not in self.nodes:
             raise ValueError(f"Source '{source_name}' not found")
 
-        node = self.nodes[source_name]
-        if not node.is_source:
-            raise ValueError(f"'{source_name}' is not a source node")
-
-        self._update_source(source_name, value)
-        self.propagate()
+        return [(source_name, value)]
 
     def _update_source(self, source_name: str, value: Any):
         """更新单个源节点的值"""
         node = self.nodes[source_name]
+        # 只比较不可变的标量值；列表 / 结构体可能被原地修改后再次推送，总是视为变化
+        unchanged = (type(value) in _SCALAR_TYPES
+                     and type(value) is type(node.cached_value)
+                     and value == node.cached_value)
         node.cached_value = value
         node.is_dirty = True
 
-        # 将所有订阅者加入优先队列
+        # 将订阅者加入待计算队列；值未变化时无状态订阅者的结果不变，
+        # 只需通知按事件累积的有状态订阅者（pre / fold）和由事件触发的流（on trigger）
         for subscriber in node.subscribers:
-            self._enqueue(subscriber)
+            if not unchanged or subscriber.is_stateful or subscriber.has_trigger:
+                self._enqueue(subscriber)
 
-    def _enqueue(self, name: str):
-        """将节点加入优先队列"""
-        if name not in self.in_queue:
-            node = self.nodes[name]
-            heapq.heappush(self.priority_queue, PriorityQueueItem(node.rank, name))
-            self.in_queue.add(name)
+    def _enqueue(self, node: GraphNode):
+        """将节点加入其 rank 对应的桶"""
+        if not node.is_queued:
+            self.rank_buckets[node.rank].append(node)
+            node.is_queued = True
 
     def propagate(self):
-        """执行变化传播（基于高度的拓扑排序）"""
-        while self.priority_queue:
-            # 从优先队列中取出 rank 最小的节点
-            item = heapq.heappop(self.priority_queue)
-            node_name = item.name
-            self.in_queue.remove(node_name)
-
-            node = self.nodes[node_name]
+        """执行变化传播（按 rank 桶顺序的拓扑求值）"""
+        buckets = self.rank_buckets
+        rank = 0
+        while rank < len(buckets):
+            pending = buckets[rank]
+            if not pending:
+                rank += 1
+                continue
+            buckets[rank] = []
 
-            # 重新计算节点的值
-            new_value = self._recompute(node)
+            for node in pending:
+                node.is_queued = False
 
-            # 如果值发生变化，通知订阅者
-            if new_value != node.cached_value:
-                node.cached_value = new_value
+                # 重新计算节点的值
+                new_value = self._recompute(node)
 
-                # 将所有订阅者加入优先队列
-                for subscriber in node.subscribers:
-                    self._enqueue(subscriber)
+                # 如果值发生变化，通知订阅者（订阅者位于更高的 rank 桶）
+                if new_value != node.cached_value:
+                    node.cached_value = new_value
+                    for subscriber in node.subscribers:
+                        self._enqueue(subscriber)
 
         self.time_step += 1
 
     def _recompute(self, node: GraphNode) -> Any:
         """重新计算节点的值"""
+        # 按位置传参的公式（编译生成的节点大多如此）：直接从依赖节点取值传入，不构建参数字典
+        # 这类节点必有公式且不是源节点，因此最先判断
+        arg_nodes = node.arg_nodes
+        if arg_nodes is not None:
+            try:
+                return node.formula(*[dep_node.cached_value for dep_node in arg_nodes])
+            except Exception as e:
+                print(f"Error computing node '{node.name}': {e}")
+                return None
+
         if node.is_source:
             return node.cached_value
 
         if node.formula is None:
             return None
 
-        # 构建参数字典
-        args = {}
-        for dep in node.dependencies:
-            if dep in self.nodes:
-                args[dep] = self.nodes[dep].cached_value
+        # 构建参数字典（每次重算新建，公式可以直接在其中添加求值所需的键）
+        args = {dep: dep_node.cached_value for dep, dep_node in node.dep_nodes}
 
         # 如果是有状态节点，传递状态
         if node.is_stateful:
@@ -283,9 +409,12 @@ class RippleEngine:
 
     def get_value(self, name: str) -> Any:
         """获取节点的当前值"""
-        if name not in self.nodes:
+        node = self.nodes.get(name)
+        if node is None:
             return None
-        return self.nodes[name].cached_value
+        if node.is_lazy:
+            node.cached_value = self._recompute(node)
+        return node.cached_value
 
     def get_sink_outputs(self) -> Dict[str, Any]:
         """获取所有 Sink 节点的输出"""
@@ -299,256 +428,390 @@ class RippleEngine:
             node_type = "SOURCE" if node.is_source else "STREAM"
             stateful = " [STATEFUL]" if node.is_stateful else ""
             print(f"[Rank {node.rank}] {node_type} {name}{stateful}")
-            print(f"  Value: {node.cached_value}")
+            print(f"  Value: {self.get_value(name)}")
             if node.dependencies:
                 print(f"  Dependencies: {', '.join(node.dependencies)}")
             if node.subscribers:
-                print(f"  Subscribers: {', '.join(node.subscribers)}")
+                print(f"  Subscribers: {', '.join(subscriber.name for subscriber in node.subscribers)}")
             print()
 
 
+# 可直接映射为 Python 二元函数的累积操作（用于 fold/reduce 快速路径）
+_ACCUMULATOR_OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+}
+_ACCUMULATOR_FUNCS = {
+    'max': max,
+    'min': min,
+}
+
+
+_UNBOUND = object()  # 名称不在上下文中的标记（查找与作用域绑定共用，一次字典查找区分“不存在”与 None）
+
+
 class ExpressionEvaluator:
     """表达式求值器"""
 
     def __init__(self, engine: RippleEngine):
         self.engine = engine
         self.user_functions: Dict[str, Any] = {}  # 用户定义的函数
+        # 内置函数表（实例级副本，编译器可替换其中的实现，例如带缓存的 CSV 加载）
+        self.builtin_functions: Dict[str, Callable] = dict(BUILTIN_FUNCTIONS)
+        self._accumulator_steps: Dict[Lambda, Optional[Callable]] = {}  # 累积函数快速路径缓存
+        self._lambda_fns: Dict[Lambda, Optional[Callable]] = {}  # Lambda 编译结果缓存
+        self._field_paths: Dict[FieldAccess, Optional[str]] = {}  # 字段访问的完整路径缓存
+        # 生成代码可调用的函数表缓存：(用户函数声明编号, 函数表)
+        self._functions_cache: Optional[Tuple[Tuple[int, ...], Dict[str, Callable]]] = None
+        # 按节点具体类型分派的求值函数（type(expr) 查表，而非 isinstance 链）
+        self._handlers: Dict[type, Callable[[Any, Dict[str, Any]], Any]] = {
+            Literal: self._eval_literal,
+            Identifier: self._eval_identifier,
+            BinaryOp: self._eval_binary_op,
+            UnaryOp: self._eval_unary_op,
+            IfExpression: self._eval_if,
+            PreOp: self._eval_pre,
+            FoldOp: self._eval_fold,
+            FunctionCall: self._eval_function_call,
+            LetExpression: self._eval_let,
+            # 数组相关表达式
+            ArrayLiteral: self._eval_array_literal,
+            ArrayAccess: self._eval_array_access,
+            MapOp: self._eval_map,
+            FilterOp: self._eval_filter,
+            ReduceOp: self._eval_reduce,
+            # 结构体相关表达式
+            StructLiteral: self._eval_struct_literal,
+            FieldAccess: self._eval_field_access,
+        }
 
     def evaluate(self, expr: Expression, context: Dict[str, Any]) -> Any:
-        """求值表达式"""
-        if isinstance(expr, Literal):
-            return expr.value
+        """求值表达式（按节点具体类型查表分派）"""
+        handler = self._handlers.get(type(expr))
+        if handler is None:
+            raise ValueError(f"Unsupported expression type: {type(expr)}")
+        return handler(expr, context)
+
+    def _eval_literal(self, expr: Literal, context: Dict[str, Any]) -> Any:
+        return expr.value
+
+    def _eval_identifier(self, expr: Identifier, context: Dict[str, Any]) -> Any:
+        value = context.get(expr.name, _UNBOUND)
+        if value is _UNBOUND:
+            raise ValueError(f"Identifier '{expr.name}' not found in context")
+        return value
+
+    def _eval_binary_op(self, expr: BinaryOp, context: Dict[str, Any]) -> Any:
+        left = self.evaluate(expr.left, context)
+        right = self.evaluate(expr.right, context)
+        return self._apply_binary_op(expr.operator, left, right)
+
+    def _eval_unary_op(self, expr: UnaryOp, context: Dict[str, Any]) -> Any:
+        operand = self.evaluate(expr.operand, context)
+        return self._apply_unary_op(expr.operator, operand)
+
+    def _eval_if(self, expr: IfExpression, context: Dict[str, Any]) -> Any:
+        condition = self.evaluate(expr.condition, context)
+        if condition:
+            return self.evaluate(expr.then_branch, context)
+        else:
+            return self.evaluate(expr.else_branch, context)
 
-        elif isinstance(expr, Identifier):
-            if expr.name in context:
-                return context[expr.name]
-            else:
-                raise ValueError(f"Identifier '{expr.name}' not found in context")
+    def _eval_pre(self, expr: PreOp, context: Dict[str, Any]) -> Any:
+        # Pre 操作符：返回前一时刻的值
+        stream_name = expr.stream_name
+        state = context.get('__temporal_state__', {})
+        pre_key = f'__pre_{stream_name}__'
+        current_node = context.get('__current_node__')
 
-        elif isinstance(expr, BinaryOp):
-            left = self.evaluate(expr.left, context)
-            right = self.evaluate(expr.right, context)
-            return self._apply_binary_op(expr.operator, left, right)
+        # 检查是否是自引用（pre(counter, 0) 在 counter 流中）
+        is_self_ref = (stream_name == current_node)
 
-        elif isinstance(expr, UnaryOp):
-            operand = self.evaluate(expr.operand, context)
-            return self._apply_unary_op(expr.operator, operand)
+        # 获取前一个值（或初始值）
+        if pre_key in state:
+            prev_value = state[pre_key]
+        else:
+            prev_value = self.evaluate(expr.initial_value, context)
 
-        elif isinstance(expr, IfExpression):
-            condition = self.evaluate(expr.condition, context)
-            if condition:
-                return self.evaluate(expr.then_branch, context)
-            else:
-                return self.evaluate(expr.else_branch, context)
+        if is_self_ref:
+            # 自引用：标记需要在计算完成后更新状态
+            # 状态更新将在外层处理（返回值会成为下次的 prev）
+            state['__self_ref_pre__'] = True
+        else:
+            # 非自引用：获取当前值并存储
+            current_value = context.get(stream_name)
+            if current_value is None and stream_name in self.engine.nodes:
+                current_value = self.engine.nodes[stream_name].cached_value
+            state[pre_key] = current_value
+
+        context['__temporal_state__'] = state
+        return prev_value
+
+    def _eval_fold(self, expr: FoldOp, context: Dict[str, Any]) -> Any:
+        # Fold 操作符：时间上的状态累积
+        # fold(stream, initial, (acc, v) => body)
+        # 每次 stream 变化时，用累积函数更新状态
+        state = context.get('__temporal_state__', {})
+        fold_key = '__fold_acc__'
+        init_key = '__fold_initialized__'
+
+        # 首次初始化时，返回初始值，不应用累积函数
+        if init_key not in state:
+            initial = self.evaluate(expr.initial, context)
+            state[fold_key] = initial
+            state[init_key] = True
+            context['__temporal_state__'] = state
+            return initial
 
-        elif isinstance(expr, PreOp):
-            # Pre 操作符：返回前一时刻的值
-            stream_name = expr.stream_name
-            state = context.get('__temporal_state__', {})
-            pre_key = f'__pre_{stream_name}__'
-            current_node = context.get('__current_node__')
+        # 获取当前累积值
+        acc = state[fold_key]
 
-            # 检查是否是自引用（pre(counter, 0) 在 counter 流中）
-            is_self_ref = (stream_name == current_node)
+        # 获取当前输入值
+        current_value = self.evaluate(expr.stream, context)
+        accumulator_func = expr.accumulator
 
-            # 获取前一个值（或初始值）
-            if pre_key in state:
-                prev_value = state[pre_key]
-            else:
-                prev_value = self.evaluate(expr.initial_value, context)
+        # 对当前值应用累积函数（单次应用）
+        step = self._accumulator_step(accumulator_func)
+        if step is not None:
+            new_acc = step(acc, current_value)
+        else:
+            new_acc = self._apply_lambda(accumulator_func, context, acc, current_value)
 
-            if is_self_ref:
-                # 自引用：标记需要在计算完成后更新状态
-                # 状态更新将在外层处理（返回值会成为下次的 prev）
-                state['__self_ref_pre__'] = True
-            else:
-                # 非自引用：获取当前值并存储
-                current_value = context.get(stream_name)
-                if current_value is None and stream_name in self.engine.nodes:
-                    current_value = self.engine.nodes[stream_name].cached_value
-                state[pre_key] = current_value
+        # 更新状态
+        state[fold_key] = new_acc
+        context['__temporal_state__'] = state
 
-            context['__temporal_state__'] = state
-            return prev_value
-
-        elif isinstance(expr, FoldOp):
-            # Fold 操作符：时间上的状态累积
-            # fold(stream, initial, (acc, v) => body)
-            # 每次 stream 变化时，用累积函数更新状态
-            state = context.get('__temporal_state__', {})
-            fold_key = '__fold_acc__'
-            init_key = '__fold_initialized__'
-
-            # 首次初始化时，返回初始值，不应用累积函数
-            if init_key not in state:
-                initial = self.evaluate(expr.initial, context)
-                state[fold_key] = initial
-                state[init_key] = True
-                context['__temporal_state__'] = state
-                return initial
-
-            # 获取当前累积值
-            acc = state[fold_key]
-
-            # 获取当前输入值
-            current_value = self.evaluate(expr.stream, context)
-            accumulator_func = expr.accumulator
-
-            # 对当前值应用累积函数（单次应用）
-            lambda_context = dict(context)
-            lambda_context[accumulator_func.parameters[0]] = acc
-            lambda_context[accumulator_func.parameters[1]] = current_value
-            new_acc = self.evaluate(accumulator_func.body, lambda_context)
-
-            # 更新状态
-            state[fold_key] = new_acc
-            context['__temporal_state__'] = state
+        return new_acc
 
-            return new_acc
-
-        elif isinstance(expr, FunctionCall):
-            # 先检查用户定义的函数
-            if expr.name in self.user_functions:
-                return self._apply_user_function(expr.name, expr.arguments, context)
-
-            # 特殊处理 count_if（带 Lambda 参数）
-            if expr.name == 'count_if' and len(expr.arguments) == 2:
-                array = self.evaluate(expr.arguments[0], context)
-                predicate = expr.arguments[1]
-                if isinstance(predicate, Lambda):
-                    count = 0
-                    for elem in array:
-                        lambda_context = dict(context)
-                        lambda_context[predicate.parameters[0]] = elem
-                        if self.evaluate(predicate.body, lambda_context):
-                            count += 1
-                    return count
-
-            # 否则使用内置函数
-            args = [self.evaluate(arg, context) for arg in expr.arguments]
-            return self._apply_function(expr.name, args)
-
-        elif isinstance(expr, LetExpression):
-            # let name = value in body
-            # 先求值 value
-            value = self.evaluate(expr.value, context)
-            # 创建扩展的上下文，包含新绑定
-            let_context = dict(context)
-            let_context[expr.name] = value
-            # 在扩展上下文中求值 body
-            return self.evaluate(expr.body, let_context)
-
-        # 数组相关表达式
-        elif isinstance(expr, ArrayLiteral):
-            return [self.evaluate(elem, context) for elem in expr.elements]
-
-        elif isinstance(expr, ArrayAccess):
-            array = self.evaluate(expr.array, context)
-            index = self.evaluate(expr.index, context)
-
-            if not isinstance(array, list):
-                raise ValueError(f"Cannot index non-array type: {type(array)}")
-            if not isinstance(index, int):
-                raise ValueError(f"Array index must be int, got: {type(index)}")
-            if index < 0 or index >= len(array):
-                raise IndexError(f"Array index {index} out of bounds (length={len(array)})")
-
-            return array[index]
-
-        elif isinstance(expr, MapOp):
-            array = self.evaluate(expr.array, context)
-
-            if not isinstance(array, list):
-                raise ValueError(f"map expects array, got: {type(array)}")
-
-            result = []
-            for elem in array:
-                elem_context = dict(context)
-                elem_context[expr.mapper.parameters[0]] = elem
-                mapped_value = self.evaluate(expr.mapper.body, elem_context)
-                result.append(mapped_value)
-
-            return result
-
-        elif isinstance(expr, FilterOp):
-            array = self.evaluate(expr.array, context)
-
-            if not isinstance(array, list):
-                raise ValueError(f"filter expects array, got: {type(array)}")
-
-            result = []
-            for elem in array:
-                elem_context = dict(context)
-                elem_context[expr.predicate.parameters[0]] = elem
-                should_include = self.evaluate(expr.predicate.body, elem_context)
-                if should_include:
-                    result.append(elem)
-
-            return result
-
-        elif isinstance(expr, ReduceOp):
-            array = self.evaluate(expr.array, context)
-
-            if not isinstance(array, list):
-                raise ValueError(f"reduce expects array, got: {type(array)}")
-
-            acc = self.evaluate(expr.initial, context)
-
-            for elem in array:
-                # 继承外部上下文，以便访问外部变量
-                lambda_context = dict(context)
-                lambda_context[expr.accumulator.parameters[0]] = acc
-                lambda_context[expr.accumulator.parameters[1]] = elem
-                acc = self.evaluate(expr.accumulator.body, lambda_context)
-
-            return acc
-
-        # 结构体相关表达式
-        elif isinstance(expr, StructLiteral):
-            return {
-                field_name: self.evaluate(field_expr, context)
-                for field_name, field_expr in expr.fields.items()
-            }
-
-        elif isinstance(expr, FieldAccess):
-            # 尝试直接查找完整字段路径（用于字段级依赖）
-            field_path = self._get_field_path(expr)
-            if field_path and field_path in context:
-                return context[field_path]
-
-            # 否则求值 object 并访问字段
-            obj = self.evaluate(expr.object, context)
-            if not isinstance(obj, dict):
-                raise ValueError(f"Cannot access field on non-struct type: {type(obj)}")
-            if expr.field_name not in obj:
-                raise ValueError(f"Struct has no field '{expr.field_name}'")
-            return obj[expr.field_name]
+    def _eval_function_call(self, expr: FunctionCall, context: Dict[str, Any]) -> Any:
+        # 先检查用户定义的函数
+        if expr.name in self.user_functions:
+            return self._apply_user_function(expr.name, expr.arguments, context)
 
-        else:
-            raise ValueError(f"Unsupported expression type: {type(expr)}")
+        # 特殊处理 count_if（带 Lambda 参数）
+        if expr.name == 'count_if' and len(expr.arguments) == 2:
+            array = self.evaluate(expr.arguments[0], context)
+            predicate = expr.arguments[1]
+            if isinstance(predicate, Lambda):
+                count = 0
+                for elem in array:
+                    if self._apply_lambda(predicate, context, elem):
+                        count += 1
+                return count
 
-    def _apply_binary_op(self, op: str, left: Any, right: Any) -> Any:
-        """应用二元操作符"""
-        operators = {
-            '+': lambda l, r: l + r,
-            '-': lambda l, r: l - r,
-            '*': lambda l, r: l * r,
-            '/': lambda l, r: l / r if r != 0 else float('inf'),
-            '%': lambda l, r: l % r,
-            '==': lambda l, r: l == r,
-            '!=': lambda l, r: l != r,
-            '<': lambda l, r: l < r,
-            '>': lambda l, r: l > r,
-            '<=': lambda l, r: l <= r,
-            '>=': lambda l, r: l >= r,
-            '&&': lambda l, r: l and r,
-            '||': lambda l, r: l or r,
+        # 否则使用内置函数
+        args = [self.evaluate(arg, context) for arg in expr.arguments]
+        return self._apply_function(expr.name, args)
+
+    def _eval_let(self, expr: LetExpression, context: Dict[str, Any]) -> Any:
+        # let name = value in body
+        # 先求值 value
+        value = self.evaluate(expr.value, context)
+        # 在绑定了 name 的上下文中求值 body
+        return self._eval_bound(expr.body, context, (expr.name,), (value,))
+
+    # 数组相关表达式
+    def _eval_array_literal(self, expr: ArrayLiteral, context: Dict[str, Any]) -> Any:
+        return [self.evaluate(elem, context) for elem in expr.elements]
+
+    def _eval_array_access(self, expr: ArrayAccess, context: Dict[str, Any]) -> Any:
+        array = self.evaluate(expr.array, context)
+        index = self.evaluate(expr.index, context)
+
+        if not isinstance(array, list):
+            raise ValueError(f"Cannot index non-array type: {type(array)}")
+        if not isinstance(index, int):
+            raise ValueError(f"Array index must be int, got: {type(index)}")
+        if index < 0 or index >= len(array):
+            raise IndexError(f"Array index {index} out of bounds (length={len(array)})")
+
+        return array[index]
+
+    def _eval_map(self, expr: MapOp, context: Dict[str, Any]) -> Any:
+        array = self.evaluate(expr.array, context)
+
+        if not isinstance(array, list):
+            raise ValueError(f"map expects array, got: {type(array)}")
+
+        return [self._apply_lambda(expr.mapper, context, elem) for elem in array]
+
+    def _eval_filter(self, expr: FilterOp, context: Dict[str, Any]) -> Any:
+        array = self.evaluate(expr.array, context)
+
+        if not isinstance(array, list):
+            raise ValueError(f"filter expects array, got: {type(array)}")
+
+        return [elem for elem in array if self._apply_lambda(expr.predicate, context, elem)]
+
+    def _eval_reduce(self, expr: ReduceOp, context: Dict[str, Any]) -> Any:
+        array = self.evaluate(expr.array, context)
+
+        if not isinstance(array, list):
+            raise ValueError(f"reduce expects array, got: {type(array)}")
+
+        acc = self.evaluate(expr.initial, context)
+
+        step = self._accumulator_step(expr.accumulator)
+        if step is not None:
+            return reduce(step, array, acc)
+
+        for elem in array:
+            acc = self._apply_lambda(expr.accumulator, context, acc, elem)
+
+        return acc
+
+    # 结构体相关表达式
+    def _eval_struct_literal(self, expr: StructLiteral, context: Dict[str, Any]) -> Any:
+        return {
+            field_name: self.evaluate(field_expr, context)
+            for field_name, field_expr in expr.fields
         }
 
-        if op in operators:
-            return operators[op](left, right)
-        else:
+    def _eval_field_access(self, expr: FieldAccess, context: Dict[str, Any]) -> Any:
+        # 尝试直接查找完整字段路径（用于字段级依赖；路径按节点缓存）
+        field_path = self._field_paths.get(expr, _UNBOUND)
+        if field_path is _UNBOUND:
+            field_path = self._field_paths[expr] = self._get_field_path(expr)
+        if field_path:
+            value = context.get(field_path, _UNBOUND)
+            if value is not _UNBOUND:
+                return value
+
+        # 否则求值 object 并访问字段
+        obj = self.evaluate(expr.object, context)
+        if not isinstance(obj, dict):
+            raise ValueError(f"Cannot access field on non-struct type: {type(obj)}")
+        if expr.field_name not in obj:
+            raise ValueError(f"Struct has no field '{expr.field_name}'")
+        return obj[expr.field_name]
+
+    def compile_functions(self) -> Dict[str, Callable]:
+        """
+        生成代码可直接调用的函数：内置函数（排除被用户函数覆盖的同名内置函数）
+        以及可编译的用户函数（用户函数定义不变时复用同一张表）
+        """
+        key = tuple(map(id, self.user_functions.values()))
+        if self._functions_cache is not None and self._functions_cache[0] == key:
+            return self._functions_cache[1]
+
+        functions = {name: fn for name, fn in self.builtin_functions.items() if name not in self.user_functions}
+        # 用户函数可能互相调用：先假定全部可编译，再逐轮剔除无法编译的函数
+        # 及调用了它们的函数，直到剩余函数全部编译成功
+        pending = dict(self.user_functions)
+        while pending:
+            functions.update(dict.fromkeys(pending))
+            compiled = {}
+            for name, decl in pending.items():
+                fn = compile_function(name, decl.parameters, decl.body, functions)
+                if fn is not None:
+                    compiled[name] = fn
+            if len(compiled) == len(pending):
+                functions.update(compiled)
+                break
+            for name in pending:
+                del functions[name]
+            pending = {name: self.user_functions[name] for name in compiled}
+
+        self._functions_cache = (key, functions)
+        return functions
+
+    def _apply_lambda(self, lam: Lambda, context: Dict[str, Any], *args: Any) -> Any:
+        """
+        应用 Lambda：优先调用编译后的函数，否则解释执行函数体
+
+        Lambda 继承外部上下文，以便访问外部变量。编译后的函数出错时
+        回退到解释执行，以给出与解释器一致的错误信息。
+        """
+        fn = self._lambda_fns.get(lam, False)
+        if fn is False:
+            fn = self._lambda_fns[lam] = (compile_lambda(lam, self.compile_functions())
+                                          if len(lam.parameters) == len(args) else None)
+        if fn is not None:
+            try:
+                return fn(context, *args)
+            except Exception:
+                pass
+
+        return self._eval_bound(lam.body, context, [lam.parameters[i] for i in range(len(args))], args)
+
+    def _eval_bound(self, body: Expression, context: Dict[str, Any], names, values) -> Any:
+        """
+        临时绑定 names 后求值 body（let、Lambda 与用户函数的作用域）
+
+        直接在 context 中绑定并在求值后恢复原值，不为每次应用复制整个上下文；
+        求值期间 context 相当于作用域栈的栈顶
+        """
+        saved = [context.get(name, _UNBOUND) for name in names]
+        for name, value in zip(names, values):
+            context[name] = value
+        try:
+            return self.evaluate(body, context)
+        finally:
+            for name, old in zip(names, saved):
+                if old is _UNBOUND:
+                    context.pop(name, None)
+                else:
+                    context[name] = old
+
+    def _accumulator_step(self, accumulator: Lambda) -> Optional[Callable]:
+        """
+        识别简单的累积函数并返回等价的 Python 二元函数
+
+        支持 (acc, x) => acc + x、acc * x、acc + 1、max(acc, x) 等形式：
+        操作数只能是两个参数或字面量。其他形式返回 None，由解释器求值。
+        """
+        if accumulator in self._accumulator_steps:
+            return self._accumulator_steps[accumulator]
+
+        step = None
+        body = accumulator.body
+        params = accumulator.parameters
+        if len(params) == 2 and params[0] != params[1]:
+            if isinstance(body, BinaryOp) and body.operator in _ACCUMULATOR_OPS:
+                fn = _ACCUMULATOR_OPS[body.operator]
+                operands = [body.left, body.right]
+            elif (isinstance(body, FunctionCall) and body.name in _ACCUMULATOR_FUNCS
+                  and body.name not in self.user_functions and len(body.arguments) == 2):
+                fn = _ACCUMULATOR_FUNCS[body.name]
+                operands = body.arguments
+            else:
+                fn = None
+            if fn is not None:
+                step = self._bind_accumulator_operands(fn, operands, params)
+
+        self._accumulator_steps[accumulator] = step
+        return step
+
+    def _bind_accumulator_operands(self, fn: Callable, operands: List[Expression],
+                                   parameters: List[str]) -> Optional[Callable]:
+        """将累积函数的两个操作数绑定为参数（0 = acc，1 = 当前元素）或字面量"""
+        bound = []
+        for operand in operands:
+            if isinstance(operand, Identifier) and operand.name in parameters:
+                bound.append(parameters.index(operand.name))
+            elif isinstance(operand, Literal):
+                bound.append(operand)
+            else:
+                return None
+
+        left, right = bound
+        if left == 0 and right == 1:
+            return fn
+        if left == 1 and right == 0:
+            return lambda acc, elem: fn(elem, acc)
+        if left == 0 and isinstance(right, Literal):
+            return lambda acc, elem: fn(acc, right.value)
+        if right == 0 and isinstance(left, Literal):
+            return lambda acc, elem: fn(left.value, acc)
+        return None
+
+    def _apply_binary_op(self, op: str, left: Any, right: Any) -> Any:
+        """应用二元操作符"""
+        fn = BINARY_OPS.get(op)
+        if fn is None:
             raise ValueError(f"Unknown binary operator: {op}")
+        return fn(left, right)
 
     def _get_field_path(self, expr: Expression) -> Optional[str]:
         """获取字段访问的完整路径，如 p.x 或 line.start.x"""
@@ -564,47 +827,16 @@ class ExpressionEvaluator:
 
     def _apply_unary_op(self, op: str, operand: Any) -> Any:
         """应用一元操作符"""
-        if op == '!':
-            return not operand
-        elif op == '-':
-            return -operand
-        else:
+        fn = UNARY_OPS.get(op)
+        if fn is None:
             raise ValueError(f"Unknown unary operator: {op}")
+        return fn(operand)
 
     def _apply_function(self, name: str, args: List[Any]) -> Any:
         """应用内置函数"""
-        builtin_functions = {
-            # 数学函数
-            'abs': lambda x: abs(x),
-            'max': lambda *args: max(args) if len(args) > 1 else max(args[0]) if isinstance(args[0], list) else args[0],
-            'min': lambda *args: min(args) if len(args) > 1 else min(args[0]) if isinstance(args[0], list) else args[0],
-            'sqrt': lambda x: x ** 0.5,
-
-            # 数组函数
-            'len': lambda arr: len(arr) if isinstance(arr, list) else len(str(arr)),
-            'head': lambda arr: arr[0] if arr else None,
-            'tail': lambda arr: arr[1:] if isinstance(arr, list) else [],
-            'last': lambda arr: arr[-1] if arr else None,
-            'sum': lambda arr: sum(arr) if isinstance(arr, list) else arr,
-            'reverse': lambda arr: list(reversed(arr)) if isinstance(arr, list) else arr,
-
-            # 矩阵函数
-            'transpose': lambda m: [[row[i] for row in m] for i in range(len(m[0]))] if m and m[0] else [],
-
-            # CSV 文件函数
-            'load_csv': lambda path, *args: _load_csv_file(path, args[0] if args else False),
-            'csv_header': lambda path: _get_csv_header(path),
-            'col': lambda data, i: _get_csv_column(data, i),
-            'row': lambda data, i: _get_csv_row(data, i),
-
-            # 统计函数
-            'avg': lambda arr: sum(arr) / len(arr) if arr else 0,
-            'count': lambda arr: len(arr),
-            'count_if': lambda arr, pred: sum(1 for x in arr if pred(x)),
-        }
-
-        if name in builtin_functions:
-            return builtin_functions[name](*args)
+        fn = self.builtin_functions.get(name)
+        if fn is not None:
+            return fn(*args)
         else:
             raise ValueError(f"Unknown function: {name}")
 
@@ -622,13 +854,16 @@ class ExpressionEvaluator:
         # 求值参数
         arg_values = [self.evaluate(arg, context) for arg in arg_exprs]
 
-        # 创建函数的局部上下文
-        func_context = dict(context)
-        for param, value in zip(func_decl.parameters, arg_values):
-            func_context[param] = value
+        # 不含自由变量的函数已编译：直接调用，出错时回退到解释执行以给出一致的错误信息
+        fn = self.compile_functions().get(name)
+        if fn is not None:
+            try:
+                return fn(*arg_values)
+            except Exception:
+                pass
 
-        # 求值函数体
-        return self.evaluate(func_decl.body, func_context)
+        # 在绑定了参数的上下文中求值函数体
+        return self._eval_bound(func_decl.body, context, func_decl.parameters, arg_values)
 
 
 # 测试代码
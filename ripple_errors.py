@@ -3,8 +3,9 @@ Ripple Language - Error Handling (错误处理)
 定义完整的错误类型和错误处理机制
 """
 
-from typing import List, Optional, Set
+from typing import Dict, List, Optional, Set
 from dataclasses import dataclass
+from ripple_ast import extract_dependencies
 
 
 class RippleError(Exception):
@@ -193,6 +194,110 @@ class CircularDependencyDetector:
         self.visited.add(start_node)
         return None
 
+    @staticmethod
+    def has_cycle(deps_graph: dict) -> bool:
+        """
+        判断依赖图中是否存在循环（迭代三色 DFS，发现第一条回边即返回）
+        无循环时只需一次 O(V+E) 遍历，不做路径回溯
+        """
+        # 0 = 未访问，1 = 在当前路径上，2 = 已完成
+        state: Dict[str, int] = {}
+        for root in deps_graph:
+            if state.get(root):
+                continue
+            state[root] = 1
+            stack = [(root, iter(deps_graph[root]))]
+            while stack:
+                node, deps = stack[-1]
+                for dep in deps:
+                    dep_state = state.get(dep, 0)
+                    if dep_state == 1:
+                        return True
+                    if dep_state == 0 and dep in deps_graph:
+                        state[dep] = 1
+                        stack.append((dep, iter(deps_graph[dep])))
+                        break
+                else:
+                    state[node] = 2
+                    stack.pop()
+        return False
+
+    @staticmethod
+    def strongly_connected_components(deps_graph: dict) -> List[List[str]]:
+        """
+        求依赖图的强连通分量（迭代 Tarjan 算法，O(V+E)，不受递归深度限制）
+        只考虑图内节点之间的边，分量按完成顺序返回
+        """
+        index: Dict[str, int] = {}
+        lowlink: Dict[str, int] = {}
+        on_stack: Set[str] = set()
+        scc_stack: List[str] = []
+        components: List[List[str]] = []
+
+        for root in deps_graph:
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            scc_stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(deps_graph[root]))]
+            while work:
+                node, deps = work[-1]
+                for dep in deps:
+                    if dep not in deps_graph:
+                        continue
+                    if dep not in index:
+                        index[dep] = lowlink[dep] = len(index)
+                        scc_stack.append(dep)
+                        on_stack.add(dep)
+                        work.append((dep, iter(deps_graph[dep])))
+                        break
+                    if dep in on_stack and index[dep] < lowlink[node]:
+                        lowlink[node] = index[dep]
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        if lowlink[node] < lowlink[parent]:
+                            lowlink[parent] = lowlink[node]
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = scc_stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(component)
+        return components
+
+    @classmethod
+    def find_cycles(cls, deps_graph: dict) -> List[List[str]]:
+        """
+        每个含循环的强连通分量报告一条代表性循环路径
+
+        路径从分量中最先声明的节点出发，沿分量内的依赖边前进直到回到已走过的节点
+        """
+        order = {name: i for i, name in enumerate(deps_graph)}
+        cycles = []
+        for component in cls.strongly_connected_components(deps_graph):
+            members = set(component)
+            start = min(component, key=order.__getitem__)
+            if len(component) == 1 and start not in deps_graph[start]:
+                continue
+            path = [start]
+            position = {start: 0}
+            node = start
+            while True:
+                node = min((dep for dep in deps_graph[node] if dep in members), key=order.__getitem__)
+                if node in position:
+                    cycles.append(path[position[node]:] + [node])
+                    break
+                position[node] = len(path)
+                path.append(node)
+        cycles.sort(key=lambda cycle: order[cycle[0]])
+        return cycles
+
     def find_all_cycles(self, deps_graph: dict) -> List[List[str]]:
         """查找所有循环依赖"""
         cycles = []
@@ -222,7 +327,7 @@ class UndefinedReferenceChecker:
 
         # 检查每个流的依赖
         for decl in stream_decls:
-            for dep in decl.static_dependencies:
+            for dep in extract_dependencies(decl.expression):
                 if not UndefinedReferenceChecker._is_defined(dep, defined_names):
                     errors.append(
                         UndefinedReferenceError(dep, decl.name)
@@ -4,6 +4,7 @@ Ripple Language - Lexer (词法分析器)
 """
 
 import re
+import sys
 from enum import Enum
 from dataclasses import dataclass
 from typing import List, Optional
@@ -248,7 +249,8 @@ class RippleLexer:
             value = True if identifier == 'true' else False
             return Token(token_type, value, start_line, start_col)
 
-        return Token(token_type, identifier, start_line, start_col)
+        # 驻留标识符，使后续按名称的字典查找可走指针比较快路径
+        return Token(token_type, sys.intern(identifier), start_line, start_col)
 
     def tokenize(self) -> List[Token]:
         """执行词法分析，返回 token 列表"""
@@ -155,7 +155,7 @@ class RippleParser:
 
         # 提取依赖关系和状态信息
         decl = StreamDecl(name, expression, trigger)
-        decl.static_dependencies = extract_dependencies(expression)
+        decl.static_dependencies = tuple(extract_dependencies(expression))
         decl.is_stateful = is_stateful_expr(expression)
 
         return decl
@@ -619,7 +619,7 @@ class RippleParser:
                 fields[field_name] = field_value
 
         self.expect(TokenType.RBRACE)
-        return StructLiteral(fields)
+        return StructLiteral(tuple(fields.items()))
 
     def parse_map_op(self) -> MapOp:
         """
@@ -692,10 +692,10 @@ if __name__ == "__main__":
 
     print("语法分析结果：")
     print("=" * 80)
-    print(ast)
+    print(ast.pretty())
     print("\n详细节点：")
     for stmt in ast.statements:
         print(f"\n{stmt}")
         if isinstance(stmt, StreamDecl):
-            print(f"  依赖: {stmt.static_dependencies}")
+            print(f"  依赖: {list(stmt.static_dependencies)}")
             print(f"  有状态: {stmt.is_stateful}")
@@ -400,7 +400,7 @@ class TypeChecker:
     def _infer_struct_literal(self, lit: StructLiteral, local_env: Dict[str, TypeNode]) -> TypeNode:
         """推断结构体字面量类型"""
         fields = {}
-        for field_name, field_expr in lit.fields.items():
+        for field_name, field_expr in lit.fields:
             fields[field_name] = self.infer_expression(field_expr, local_env)
         return StructType(fields)
 
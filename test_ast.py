@@ -0,0 +1,112 @@
+"""
+Ripple AST 输出测试
+程序的文本表示、JSON 可视化输出与依赖分析
+"""
+
+import json
+
+from ripple_lexer import RippleLexer
+from ripple_parser import RippleParser
+from ripple_ast import extract_dependencies
+from ripple_ast_visualizer import visualize_ast
+
+
+CODE = """
+source a : int := 1;
+stream b <- a * 2;
+sink out <- b;
+"""
+
+
+def test_program_pretty():
+    """测试程序的完整文本表示与概要 repr"""
+    print("=" * 60)
+    print("测试: 程序文本表示")
+    print("=" * 60)
+
+    program = RippleParser(RippleLexer(CODE).tokenize()).parse()
+    text = program.pretty()
+    print(text)
+
+    lines = text.split('\n')
+    assert lines[0] == "Program:"
+    assert len(lines) == 1 + len(program.statements)
+    assert lines[1:] == [str(stmt) for stmt in program.statements]
+    assert lines[2].startswith("stream b <- ")
+
+    assert repr(program) == "Program(3 statements)"
+
+    print("\n✓ 测试通过!")
+
+
+def test_compact_json():
+    """测试紧凑 JSON 输出与缩进输出内容一致"""
+    print("=" * 60)
+    print("测试: 紧凑 JSON 输出")
+    print("=" * 60)
+
+    compact = visualize_ast(CODE, 'json', indent=None)
+    indented = visualize_ast(CODE, 'json')
+    print(f"  紧凑: {len(compact)} 字符, 缩进: {len(indented)} 字符")
+
+    assert '\n' not in compact
+    assert ', ' not in compact and ': ' not in compact
+    assert json.loads(compact) == json.loads(indented)
+
+    data = json.loads(compact)
+    assert data['_type'] == 'Program'
+    assert [stmt['_type'] for stmt in data['statements']] == ['SourceDecl', 'StreamDecl', 'SinkDecl']
+
+    print("\n✓ 测试通过!")
+
+
+def test_extract_dependencies_memo():
+    """测试依赖分析结果记录在节点上，局部变量按作用域过滤"""
+    print("=" * 60)
+    print("测试: 依赖分析记录")
+    print("=" * 60)
+
+    code = "stream s <- let a = x in map(ys, (e) => e + a + z);"
+    program = RippleParser(RippleLexer(code).tokenize()).parse()
+    expr = program.statements[0].expression
+
+    deps = extract_dependencies(expr)
+    print(f"  依赖: {deps} (预期: ['x', 'ys', 'z'])")
+    assert deps == ['x', 'ys', 'z']
+    assert expr._deps == ('x', 'ys', 'z')
+
+    # 返回副本，修改不影响记录
+    deps.append('w')
+    assert extract_dependencies(expr) == ['x', 'ys', 'z']
+
+    # 子树已有记录时按局部变量过滤
+    body = expr.body
+    assert extract_dependencies(body) == ['ys', 'a', 'z']
+    assert extract_dependencies(body, {'a'}) == ['ys', 'z']
+    assert body._deps == ('ys', 'a', 'z')
+
+    print("\n✓ 测试通过!")
+
+
+def run_all_tests():
+    """运行所有测试"""
+    print("\n" + "=" * 60)
+    print("Ripple AST 输出测试")
+    print("=" * 60)
+
+    try:
+        test_program_pretty()
+        test_compact_json()
+        test_extract_dependencies_memo()
+
+        print("\n" + "=" * 60)
+        print("🎉 所有测试通过!")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    run_all_tests()
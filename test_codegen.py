@@ -0,0 +1,153 @@
+"""
+Ripple 代码生成测试
+生成代码（常量折叠、公共子表达式消除、let / map / filter / reduce、用户函数）
+必须与解释器给出相同的结果
+"""
+
+from ripple_lexer import RippleLexer
+from ripple_parser import RippleParser
+from ripple_engine import RippleEngine, ExpressionEvaluator, BUILTIN_FUNCTIONS
+from ripple_codegen import compile_expression, compile_positional, fold_constants
+from ripple_compiler import RippleCompiler
+
+
+def parse_expr(src: str):
+    """解析单个流表达式"""
+    program = RippleParser(RippleLexer(f"stream out <- {src};").tokenize()).parse()
+    return program.statements[0].expression
+
+
+def check_same_as_interpreter(src: str, env: dict):
+    """生成代码（按字典与按位置两种形式）与解释器结果一致，且不依赖回退"""
+    expr = parse_expr(src)
+    expected = ExpressionEvaluator(RippleEngine()).evaluate(expr, dict(env))
+
+    compiled = compile_expression(expr, 'out', BUILTIN_FUNCTIONS)
+    assert compiled is not None, f"未能编译: {src}"
+    assert compiled(dict(env)) == expected, src
+
+    def fallback(args):
+        raise AssertionError(f"生成代码出错并回退: {src}")
+
+    positional = compile_positional(expr, 'out', fallback, BUILTIN_FUNCTIONS)
+    if positional is not None:
+        fn, dep_order = positional
+        assert fn(*[env[name] for name in dep_order]) == expected, src
+
+    # 常量折叠后结果不变
+    folded = compile_expression(fold_constants(expr), 'out', BUILTIN_FUNCTIONS)
+    assert folded(dict(env)) == expected, src
+    return expected
+
+
+def test_codegen_matches_interpreter():
+    """测试生成代码与解释器一致"""
+    print("=" * 60)
+    print("测试: 生成代码与解释器一致")
+    print("=" * 60)
+
+    cases = [
+        ("a * 2 + b", {'a': 3, 'b': 4}),
+        ("if a > b then a - b else b - a end", {'a': 3, 'b': 7}),
+        ("a / 0", {'a': 1}),
+        ("!(a > 1) || b == 2", {'a': 3, 'b': 2}),
+        ("xs[1] + len(xs)", {'xs': [5, 6, 7]}),
+        ("{x: a, y: a * 2}", {'a': 3}),
+        ("let d = a - b in d * d", {'a': 5, 'b': 2}),
+        ("let a = a + 1 in let a = a * 2 in a + b", {'a': 3, 'b': 1}),
+        ("map(xs, (e) => e * k)", {'xs': [1, 2, 3], 'k': 2}),
+        ("filter(xs, (e) => e > k)", {'xs': [1, 5, 3], 'k': 2}),
+        ("reduce(xs, 0, (acc, e) => acc + e * k)", {'xs': [1, 2, 3], 'k': 2}),
+        ("map(xs, (e) => map(ys, (f) => e * f))", {'xs': [1, 2], 'ys': [3, 4]}),
+    ]
+    for src, env in cases:
+        result = check_same_as_interpreter(src, env)
+        print(f"  {src} = {result}")
+
+    print("\n✓ 测试通过!")
+
+
+def test_codegen_nested_common_subexpressions():
+    """测试嵌套的重复子表达式（公共子表达式消除）"""
+    print("=" * 60)
+    print("测试: 嵌套的重复子表达式")
+    print("=" * 60)
+
+    cases = [
+        ("[1, 2, 3][1] + [1, 2, 3][1] + sum([1, 2, 3])", {}),
+        ("xs[i] + xs[i] + sum(xs)", {'xs': [1, 2, 3], 'i': 1}),
+        ("(abs(a * b) + abs(a * b)) / max(abs(b), len([1, 2, 3]))", {'a': 2, 'b': -3}),
+        ("(a + b) * (a + b) + ((a + b) * (a + b) - a)", {'a': 2, 'b': 5}),
+        ("if a > 0 then (a * b) + (a * b) else a * b end", {'a': 1, 'b': 4}),
+    ]
+    for src, env in cases:
+        result = check_same_as_interpreter(src, env)
+        print(f"  {src} = {result}")
+
+    assert check_same_as_interpreter("[1, 2, 3][1] + [1, 2, 3][1] + sum([1, 2, 3])", {}) == 10
+    assert check_same_as_interpreter("xs[i] + xs[i] + sum(xs)", {'xs': [1, 2, 3], 'i': 1}) == 10
+
+    print("\n✓ 测试通过!")
+
+
+def test_compiled_program_matches_interpreter():
+    """测试整个程序（含用户函数与重复子表达式）的计算结果"""
+    print("=" * 60)
+    print("测试: 程序计算结果")
+    print("=" * 60)
+
+    code = """
+    func f1(n) = n + 1;
+    func fact(n) = if n <= 1 then 1 else n * fact(n - 1) end;
+
+    source b : int := -3;
+
+    stream s <- [1, 2, 3][1] + [1, 2, 3][1] + sum([1, 2, 3]);
+    stream r <- (f1(sum([1, 2, 3])) + f1(sum([1, 2, 3]))) / max(abs(b), len([1, 2, 3]));
+    stream f <- fact(abs(b));
+
+    sink s_out <- s;
+    sink r_out <- r;
+    sink f_out <- f;
+    """
+
+    engine = RippleCompiler().run(code)
+    outputs = engine.get_sink_outputs()
+    print(f"  s = {outputs['s_out']} (预期: 10)")
+    print(f"  r = {outputs['r_out']:.2f} (预期: 4.67)")
+    print(f"  f = {outputs['f_out']} (预期: 6)")
+
+    assert outputs['s_out'] == 10
+    assert abs(outputs['r_out'] - 14 / 3) < 1e-9
+    assert outputs['f_out'] == 6
+
+    engine.push_event('b', -4)
+    outputs = engine.get_sink_outputs()
+    assert outputs['r_out'] == 3.5
+    assert outputs['f_out'] == 24
+
+    print("\n✓ 测试通过!")
+
+
+def run_all_tests():
+    """运行所有测试"""
+    print("\n" + "=" * 60)
+    print("Ripple 代码生成测试")
+    print("=" * 60)
+
+    try:
+        test_codegen_matches_interpreter()
+        test_codegen_nested_common_subexpressions()
+        test_compiled_program_matches_interpreter()
+
+        print("\n" + "=" * 60)
+        print("🎉 所有测试通过!")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,388 @@
+"""
+Ripple 引擎传播测试
+源节点更新、事件触发与批量推送的传播行为
+"""
+
+import os
+import tempfile
+
+from ripple_ast import (Program, SourceDecl, StreamDecl, SinkDecl,
+                        BasicType, Literal, Identifier, BinaryOp)
+from ripple_compiler import RippleCompiler
+from ripple_engine import RippleEngine
+from ripple_errors import CompileError
+
+
+def test_trigger_on_repeated_value():
+    """测试触发源推送相同的值时仍然触发"""
+    print("=" * 60)
+    print("测试: 触发源重复推送相同的值")
+    print("=" * 60)
+
+    code = """
+    source x : int := 0;
+    source tick : int := 0;
+
+    stream snap <- x on tick;
+
+    sink out <- snap;
+    """
+
+    engine = RippleCompiler().run(code)
+
+    engine.push_event('x', 5)
+    # 事件值逐个解析，两次推送的是相等但不同的对象
+    for raw in ['100000', '100000']:
+        engine.push_event('tick', int(raw))
+    outputs = engine.get_sink_outputs()
+    print(f"  x = 5, tick 两次推送 100000 后 snap = {outputs['out']} (预期: 5)")
+    assert outputs['out'] == 5
+
+    # 只更新 x 时 snap 保持不变，再次以相同的值触发后才更新
+    engine.push_event('x', 7)
+    assert engine.get_sink_outputs()['out'] == 5
+    engine.push_event('tick', int('100000'))
+    outputs = engine.get_sink_outputs()
+    print(f"  x = 7, tick 再次推送 100000 后 snap = {outputs['out']} (预期: 7)")
+    assert outputs['out'] == 7
+
+    print("\n✓ 测试通过!")
+
+
+def test_push_same_value():
+    """测试推送相同的值：无状态流结果不变，pre / fold 仍按事件累积"""
+    print("=" * 60)
+    print("测试: 推送相同的值")
+    print("=" * 60)
+
+    code = """
+    source x : int := 0;
+
+    stream doubled <- x * 2;
+    stream count <- fold(x, 0, (acc, v) => acc + 1);
+
+    sink doubled_out <- doubled;
+    sink count_out <- count;
+    """
+
+    engine = RippleCompiler().run(code)
+    engine.push_event('x', 3)
+    engine.push_event('x', 3)
+    outputs = engine.get_sink_outputs()
+    print(f"  doubled = {outputs['doubled_out']} (预期: 6)")
+    print(f"  count = {outputs['count_out']} (预期: 2)")
+    assert outputs['doubled_out'] == 6
+    assert outputs['count_out'] == 2
+
+    print("\n✓ 测试通过!")
+
+
+def test_push_mutated_list():
+    """测试原地修改后再次推送同一个列表"""
+    print("=" * 60)
+    print("测试: 原地修改后推送同一个列表")
+    print("=" * 60)
+
+    code = """
+    source xs : [int] := [1, 2];
+
+    stream total <- sum(xs);
+
+    sink out <- total;
+    """
+
+    engine = RippleCompiler().run(code)
+    values = [1, 2, 3]
+    engine.push_event('xs', values)
+    assert engine.get_sink_outputs()['out'] == 6
+
+    values.append(4)
+    engine.push_event('xs', values)
+    outputs = engine.get_sink_outputs()
+    print(f"  total = {outputs['out']} (预期: 10)")
+    assert outputs['out'] == 10
+
+    print("\n✓ 测试通过!")
+
+
+def test_push_events_batch():
+    """测试批量推送：受多个源影响的节点每批只计算一次"""
+    print("=" * 60)
+    print("测试: 批量推送事件")
+    print("=" * 60)
+
+    code = """
+    source a : int := 0;
+    source b : int := 0;
+    source point : { x: int, y: int } := { x: 0, y: 0 };
+
+    stream total <- a + b;
+    stream steps <- fold(total, 0, (acc, v) => acc + 1);
+    stream dist <- point.x + point.y;
+
+    sink total_out <- total;
+    sink steps_out <- steps;
+    sink dist_out <- dist;
+    """
+
+    engine = RippleCompiler().run(code)
+    start = engine.get_sink_outputs()['steps_out']
+
+    engine.push_events({'a': 1, 'b': 2, 'point': {'x': 3, 'y': 4}})
+    outputs = engine.get_sink_outputs()
+    print(f"  total = {outputs['total_out']} (预期: 3)")
+    print(f"  steps 增加 {outputs['steps_out'] - start} (预期: 1)")
+    print(f"  dist = {outputs['dist_out']} (预期: 7)")
+    assert outputs['total_out'] == 3
+    assert outputs['steps_out'] == start + 1
+    assert outputs['dist_out'] == 7
+
+    print("\n✓ 测试通过!")
+
+
+def test_push_events_unknown_name():
+    """测试批量推送包含无效名称时不修改任何状态"""
+    print("=" * 60)
+    print("测试: 批量推送包含无效名称")
+    print("=" * 60)
+
+    code = """
+    source a : int := 0;
+    source b : int := 0;
+
+    stream total <- a + b;
+
+    sink total_out <- total;
+    """
+
+    engine = RippleCompiler().run(code)
+    engine.push_events({'a': 1, 'b': 2})
+
+    try:
+        engine.push_events({'a': 10, 'missing': 5})
+        assert False, "应抛出 ValueError"
+    except ValueError as e:
+        print(f"  ✓ 正确抛出错误: {e}")
+
+    assert engine.get_value('a') == 1
+    assert engine.get_sink_outputs()['total_out'] == 3
+    assert not any(engine.rank_buckets)
+
+    # 之后的推送正常传播
+    engine.push_events({'a': 10, 'b': 5})
+    outputs = engine.get_sink_outputs()
+    print(f"  total = {outputs['total_out']} (预期: 15)")
+    assert outputs['total_out'] == 15
+
+    print("\n✓ 测试通过!")
+
+
+def test_lazy_struct_source():
+    """测试只按字段访问的结构体源按需组装"""
+    print("=" * 60)
+    print("测试: 结构体源按需组装")
+    print("=" * 60)
+
+    code = """
+    source p : { x: int, y: int } := { x: 1, y: 2 };
+
+    stream s <- p.x + p.y;
+
+    sink out <- s;
+    """
+
+    engine = RippleCompiler().run(code)
+    assert engine.nodes['p'].is_lazy
+    assert engine.get_value('p') == {'x': 1, 'y': 2}
+
+    # 字段更新后读取时再组装
+    engine.push_event('p', {'x': 5})
+    print(f"  p = {engine.get_value('p')} (预期: {{'x': 5, 'y': 2}})")
+    assert engine.get_value('p') == {'x': 5, 'y': 2}
+    assert engine.get_sink_outputs()['out'] == 7
+
+    # 有了整体引用的依赖者后恢复为随字段更新
+    engine.add_stream('scaled', lambda args: args['p']['x'] * 10, {'p'})
+    assert not engine.nodes['p'].is_lazy
+    engine.push_event('p', {'x': 7})
+    print(f"  scaled = {engine.get_value('scaled')} (预期: 70)")
+    assert engine.get_value('scaled') == 70
+    assert engine.get_sink_outputs()['out'] == 9
+
+    # 程序中整体引用的结构体源不按需组装
+    code = """
+    source p : { x: int, y: int } := { x: 1, y: 2 };
+
+    stream whole <- p;
+
+    sink out <- whole;
+    """
+
+    engine = RippleCompiler().run(code)
+    assert not engine.nodes['p'].is_lazy
+    engine.push_event('p', {'y': 4})
+    assert engine.get_sink_outputs()['out'] == {'x': 1, 'y': 4}
+
+    print("\n✓ 测试通过!")
+
+
+def test_hand_built_declarations():
+    """测试不经解析器构造的声明：依赖由表达式得出，排序与循环检测照常进行"""
+    print("=" * 60)
+    print("测试: 手工构造的声明")
+    print("=" * 60)
+
+    # 流的声明顺序与依赖顺序相反
+    program = Program([
+        SourceDecl('a', BasicType('int'), Literal(1, 'int')),
+        SinkDecl('out', Identifier('c')),
+        StreamDecl('c', BinaryOp('+', Identifier('b'), Literal(1, 'int'))),
+        StreamDecl('b', BinaryOp('*', Identifier('a'), Literal(2, 'int'))),
+    ])
+    compiler = RippleCompiler()
+    compiler.compile(program)
+    engine = compiler.engine
+
+    assert engine.nodes['c'].rank > engine.nodes['b'].rank
+    assert engine.get_sink_outputs()['out'] == 3
+    engine.push_event('a', 5)
+    outputs = engine.get_sink_outputs()
+    print(f"  out = {outputs['out']} (预期: 11)")
+    assert outputs['out'] == 11
+
+    program = Program([
+        StreamDecl('x', Identifier('y')),
+        StreamDecl('y', Identifier('x')),
+    ])
+    try:
+        RippleCompiler().compile(program)
+        assert False, "应检测到循环依赖"
+    except CompileError as e:
+        print(f"  ✓ 正确检测到循环依赖")
+        assert "Circular dependency" in str(e)
+
+    print("\n✓ 测试通过!")
+
+
+def test_dependency_registered_late():
+    """测试依赖晚于依赖者注册时，重算仍能读到它的值"""
+    print("=" * 60)
+    print("测试: 依赖晚于依赖者注册")
+    print("=" * 60)
+
+    engine = RippleEngine()
+    engine.add_source('a', 1)
+    engine.add_stream('total', lambda args: args['a'] + args.get('b', 0), {'a', 'b'})
+    engine.add_source('b', 10)
+
+    engine.push_event('a', 2)
+    print(f"  total = {engine.get_value('total')} (预期: 12)")
+    assert engine.get_value('total') == 12
+
+    # 按位置传参的依赖必须已注册
+    try:
+        engine.add_stream('late', lambda c: c, {'c'}, arg_names=('c',))
+        assert False, "应抛出 ValueError"
+    except ValueError as e:
+        print(f"  ✓ 正确抛出错误: {e}")
+    assert 'late' not in engine.nodes
+
+    print("\n✓ 测试通过!")
+
+
+def test_csv_sources_share_file():
+    """测试多个源加载同一个 CSV 文件：只解析一次，各自得到独立的列表"""
+    print("=" * 60)
+    print("测试: 多个源加载同一个 CSV 文件")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'data.csv').replace('\\', '/')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("a,b\n1,2\n3,4\n")
+
+        code = f"""
+        source first := load_csv("{path}", true);
+        source second := load_csv("{path}", true);
+
+        stream total <- sum(col(first, 0)) + sum(col(second, 1));
+
+        sink out <- total;
+        """
+
+        compiler = RippleCompiler()
+        engine = compiler.run(code)
+        first, second = engine.get_value('first'), engine.get_value('second')
+        print(f"  first = {first}, second = {second}")
+        assert first == second == [[1, 2], [3, 4]]
+        assert first is not second and first[0] is not second[0]
+        assert len(compiler._csv_cache) == 1
+        assert engine.get_sink_outputs()['out'] == 10
+
+    print("\n✓ 测试通过!")
+
+
+def test_csv_cache_copies_and_reloads():
+    """测试 CSV 缓存：返回副本，文件在同一时间戳内被改写时重新解析"""
+    print("=" * 60)
+    print("测试: CSV 缓存的副本与重新加载")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'data.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("a,b\n1,2\n")
+        mtime_ns = os.stat(path).st_mtime_ns
+
+        compiler = RippleCompiler()
+        load_csv = compiler.evaluator.builtin_functions['load_csv']
+        csv_header = compiler.evaluator.builtin_functions['csv_header']
+
+        data = load_csv(path, True)
+        data[0][0] = 99
+        data.append([5, 6])
+        assert load_csv(path, True) == [[1, 2]]
+        header = csv_header(path)
+        header.append('c')
+        assert csv_header(path) == ['a', 'b']
+
+        # 改写文件并恢复原来的修改时间：按大小区分
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("a,b\n1,2\n3,4\n")
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+        reloaded = load_csv(path, True)
+        print(f"  改写后: {reloaded} (预期: [[1, 2], [3, 4]])")
+        assert reloaded == [[1, 2], [3, 4]]
+
+    print("\n✓ 测试通过!")
+
+
+def run_all_tests():
+    """运行所有测试"""
+    print("\n" + "=" * 60)
+    print("Ripple 引擎传播测试")
+    print("=" * 60)
+
+    try:
+        test_trigger_on_repeated_value()
+        test_push_same_value()
+        test_push_mutated_list()
+        test_push_events_batch()
+        test_push_events_unknown_name()
+        test_lazy_struct_source()
+        test_hand_built_declarations()
+        test_dependency_registered_late()
+        test_csv_sources_share_file()
+        test_csv_cache_copies_and_reloads()
+
+        print("\n" + "=" * 60)
+        print("🎉 所有测试通过!")
+        print("=" * 60)
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    run_all_tests()